@@ -1,10 +1,13 @@
 import polars as pl
+import datetime as dt
 import sf_quant.backtester as sfb
 import sf_quant.optimizer as sfo
 from pathlib import Path
 import click
 import os
 
+from research.storage import scan_dataset
+
 @click.command()
 @click.argument('signal_name', type=str)
 @click.argument('year', type=int)
@@ -23,14 +26,15 @@ def main(signal_name: str, year: int, gamma: float, n_cpus: int | None):
     
     click.echo(f"Processing signal={signal_name} for year={year} with {n_cpus} CPUs")
     
+    start, end = dt.date(year, 1, 1), dt.date(year, 12, 31)
     alphas = (
-        pl.scan_parquet(f"data/alphas/{signal_name}.parquet")
+        scan_dataset(f"alphas/{signal_name}", start, end)
         .join(
-            pl.scan_parquet("data/barra/barra_*.parquet").select('date', 'barrid', 'predicted_beta'),
+            scan_dataset("barra", start, end).select('date', 'barrid', 'predicted_beta'),
             on=['date', 'barrid'],
             how='left'
         )
-        .filter(pl.col("date").dt.year().eq(year))
+        .with_columns(pl.col('barrid').cast(pl.String))
         .collect()
     )
     
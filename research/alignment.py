@@ -0,0 +1,55 @@
+import datetime as dt
+import re
+
+import polars as pl
+
+from research.storage import ID_COLUMNS, scan_dataset
+
+
+def max_staleness(name: str) -> dt.timedelta:
+    """How old a row of a slow-moving dataset may be and still be attached."""
+    match name:
+        case "dmom_coefficients/dmom_coefficients":
+            # Estimated at month-ends
+            return dt.timedelta(days=35)
+        case "dmom_coefficients/market_data":
+            return dt.timedelta(days=7)
+        case _ if re.fullmatch(r"(crsp|barra)_\w+?_betas(_\d+)?", name):
+            # Daily, or at the output dates of the estimation
+            return dt.timedelta(days=35)
+        case _:
+            raise ValueError(f"No staleness limit declared for dataset: {name}")
+
+
+def align_asof(
+    data: pl.LazyFrame,
+    name: str,
+    start: dt.date | None = None,
+    end: dt.date | None = None,
+    tolerance: dt.timedelta | None = None,
+) -> pl.LazyFrame:
+    """Attach the latest row of data/{name} at or before each row's date.
+
+    Rows older than the dataset's staleness limit are not attached. Date-only
+    datasets are aligned on the distinct dates of data and joined back by
+    date, so the panel never has to be re-sorted. Datasets with an id column
+    are aligned per asset, relying on scan_dataset returning each asset's
+    rows in date order. Only the scanned range [start - tolerance, end] of
+    data/{name} is read.
+    """
+    tolerance = tolerance or max_staleness(name)
+    other = scan_dataset(name, None if start is None else start - tolerance, end)
+    by = [col for col in ID_COLUMNS if col in other.collect_schema().names()]
+
+    if by:
+        return data.join_asof(
+            other, on="date", by=by, tolerance=tolerance, check_sortedness=False
+        )
+
+    aligned = (
+        data.select("date")
+        .unique()
+        .sort("date")
+        .join_asof(other.sort("date"), on="date", tolerance=tolerance)
+    )
+    return data.join(aligned, on="date", how="left", maintain_order="left")
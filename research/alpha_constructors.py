@@ -9,7 +9,7 @@ def cross_sectional_z_score(signal_name: str) -> AlphaConstructor:
     return AlphaConstructor(
         name=cross_sectional_z_score.__name__,
         expr=pl.lit(0.05).mul(score).mul(pl.col("specific_risk")).alias("alpha"),
-        columns=["specific_risk"],
+        columns=["date", "specific_risk", signal_name],
     )
 
 
@@ -24,8 +24,8 @@ def get_alpha_constructor(alpha_constructor_name: str, signal_name) -> AlphaCons
 
 
 def construct_alphas(
-    signals: pl.DataFrame, alpha_constructor: AlphaConstructor
-) -> pl.DataFrame:
+    signals: pl.DataFrame | pl.LazyFrame, alpha_constructor: AlphaConstructor
+) -> pl.DataFrame | pl.LazyFrame:
     return signals.with_columns(alpha_constructor.expr).with_columns(
         pl.col("alpha").fill_null(0)
     )
@@ -7,35 +7,178 @@ from barra_ff3_betas import barra_ff3_betas_flow
 from momentum_factor_returns import momentum_factor_returns_flow
 from dmom_coefficients import dmom_coefficents_history_flow
 from alphas import alphas_flow
+from pipeline import run_pipeline
+from residuals import factor_residuals_flow, residuals_dataset
+from forward_returns import forward_returns_flow
+from panels import ASOF_DATASETS, PANELS, monthly_panel_flow, panel_dataset, panel_flow
+from research.data.betas import betas_dataset
+from research.models import Stage
+from research.returns import SOURCES, forward_returns_dataset
 import datetime as dt
+import sys
 
-def main():
+def main(incremental: bool = False, force: bool = False):
     blitz_start = dt.date(1963, 7, 31)
     hanauer_start = dt.date(1930, 1, 1)
     barra_start = dt.date(1995, 7, 31)
     end = dt.date(2024, 12, 31)
 
-    # Base datasets
-    crsp_history_flow(hanauer_start, end)
-    barra_history_flow(barra_start, end)
+    factor_models = ["capm", "ff3", "ff5"]
+    ff3 = "fama_french_factors/ff3"
+    ff5 = "fama_french_factors/ff5"
+    momentum_factor_returns = "momentum_factor_returns/momentum_factor_returns"
 
-    # Factor datasets
-    fama_french_3_factors_history_flow()
-    fama_french_5_factors_history_flow()
+    stages = [
+        # Base datasets
+        Stage(
+            name="crsp",
+            flow=crsp_history_flow,
+            inputs=[],
+            outputs=["crsp"],
+            kwargs={"start": hanauer_start, "end": end},
+        ),
+        Stage(
+            name="barra",
+            flow=barra_history_flow,
+            inputs=[],
+            outputs=["barra"],
+            kwargs={"start": barra_start, "end": end},
+        ),
+        # Factor datasets
+        Stage(
+            name="fama_french_3_factors",
+            flow=fama_french_3_factors_history_flow,
+            inputs=[],
+            outputs=[ff3],
+        ),
+        Stage(
+            name="fama_french_5_factors",
+            flow=fama_french_5_factors_history_flow,
+            inputs=[],
+            outputs=[ff5],
+        ),
+        # Betas
+        Stage(
+            name="crsp_betas",
+            flow=crsp_ff3_betas_flow,
+            inputs=["crsp", ff5],
+            outputs=[betas_dataset("crsp", model) for model in factor_models],
+            kwargs={
+                "start": blitz_start,
+                "end": end,
+                "incremental": incremental,
+                "models": factor_models,
+            },
+            process_pool=True,
+        ),
+        Stage(
+            name="barra_betas",
+            flow=barra_ff3_betas_flow,
+            inputs=["barra", ff5],
+            outputs=[betas_dataset("barra", model) for model in factor_models],
+            kwargs={
+                "start": barra_start,
+                "end": end,
+                "incremental": incremental,
+                "models": factor_models,
+            },
+            process_pool=True,
+        ),
+        # Residual returns
+        Stage(
+            name="crsp_residuals",
+            flow=factor_residuals_flow,
+            inputs=["crsp", ff5] + [betas_dataset("crsp", model) for model in factor_models],
+            outputs=[residuals_dataset("crsp", model) for model in factor_models],
+            kwargs={
+                "name": "crsp",
+                "source": "crsp",
+                "id_col": "permno",
+                "start": blitz_start,
+                "end": end,
+                "models": factor_models,
+            },
+        ),
+        Stage(
+            name="barra_residuals",
+            flow=factor_residuals_flow,
+            inputs=["barra", ff5] + [betas_dataset("barra", model) for model in factor_models],
+            outputs=[residuals_dataset("barra", model) for model in factor_models],
+            kwargs={
+                "name": "barra",
+                "source": "barra",
+                "id_col": "barrid",
+                "start": barra_start,
+                "end": end,
+                "models": factor_models,
+            },
+        ),
+        # Alphas
+        Stage(
+            name="alphas",
+            flow=alphas_flow,
+            inputs=[
+                "barra",
+                ff5,
+                betas_dataset("barra", "ff3"),
+                residuals_dataset("barra", "ff3"),
+            ],
+            outputs=["alphas"],
+            kwargs={"start": barra_start, "end": end, "incremental": incremental},
+        ),
+        # Momentum factor returns
+        Stage(
+            name="momentum_factor_returns",
+            flow=momentum_factor_returns_flow,
+            inputs=[],
+            outputs=[momentum_factor_returns],
+        ),
+        # D-Mom coefficients
+        Stage(
+            name="dmom_coefficients",
+            flow=dmom_coefficents_history_flow,
+            inputs=[ff3, momentum_factor_returns],
+            outputs=["dmom_coefficients/dmom_coefficients", "dmom_coefficients/market_data"],
+            kwargs={"start": hanauer_start, "end": end},
+        ),
+    ]
 
-    # Betas
-    crsp_ff3_betas_flow(blitz_start, end)
-    barra_ff3_betas_flow(barra_start, end)
+    # Forward returns read by construct_returns and construct_returns_from_weights
+    stages += [
+        Stage(
+            name=f"{source}_forward_returns",
+            flow=forward_returns_flow,
+            inputs=[source],
+            outputs=[forward_returns_dataset(source)],
+            kwargs={"source": source},
+        )
+        for source in SOURCES
+    ]
 
-    # Alphas
-    alphas_flow(barra_start, end)
+    # Joined analysis panels shared by the experiments
+    stages += [
+        Stage(
+            name=f"{panel}_panel",
+            flow=panel_flow,
+            inputs=inputs,
+            outputs=[panel_dataset(panel)],
+            kwargs={"name": panel, "start": blitz_start, "end": end},
+        )
+        for panel, inputs in PANELS.items()
+    ]
+    stages += [
+        Stage(
+            name=f"{panel}_monthly_panel",
+            flow=monthly_panel_flow,
+            inputs=[panel_dataset(panel), *ASOF_DATASETS[panel], forward_returns_dataset("crsp")],
+            outputs=[panel_dataset(f"{panel}_monthly")],
+            kwargs={"name": panel, "start": blitz_start, "end": end},
+        )
+        for panel in PANELS
+    ]
 
-    # Momentum factor returns
-    momentum_factor_returns_flow()
-
-    # D-Mom coefficients
-    dmom_coefficents_history_flow(hanauer_start, end)
+    run_pipeline(stages, force=force)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main(incremental="--incremental" in sys.argv, force="--force" in sys.argv)
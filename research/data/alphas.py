@@ -1,12 +1,35 @@
 import polars as pl
 import datetime as dt
-from research.signals import get_signal, construct_signals
-from research.filters import get_filter, apply_filters
+import sys
+from research.alignment import align_asof
+from research.signals import (
+    cached_signals,
+    construct_filtered_signals,
+    get_signal,
+    select_declared_columns,
+)
+from research.filters import get_filter
 from research.alpha_constructors import get_alpha_constructor, construct_alphas
-from pathlib import Path
+from research.signal_state import (
+    advance_signal_state,
+    init_signal_state,
+    last_state_date,
+    save_state,
+    state_exists,
+)
+from research.storage import scan_dataset, shift_trading_days, write_dataset
 
+# Rolling state of the alpha signals, advanced by incremental runs
+STATE_NAME = "alphas"
+RESIDUALS = "barra_ff3_residuals"
 
-def alphas_flow(start: dt.date, end: dt.date):
+
+def alphas_flow(start: dt.date, end: dt.date, incremental: bool = False):
+    """Write the daily alphas of each signal to data/alphas/{signal_name}.
+
+    Incremental runs only add the days after the last run. They advance the
+    signals' rolling state instead of recomputing the Barra history.
+    """
     signal_names = [
         # "momentum",
         # "idiosyncratic_momentum_fama_french_3",
@@ -16,33 +39,66 @@ def alphas_flow(start: dt.date, end: dt.date):
     ]
     
     filter_names = ["low-price-stocks"]
-    filters = [get_filter(filter_name) for filter_name in filter_names]
+    signals = [get_signal(signal_name, id_col="barrid") for signal_name in signal_names]
+    filters = {
+        signal.name: [get_filter(filter_name) for filter_name in filter_names]
+        for signal in signals
+    }
+    alpha_constructor_name = "cross-sectional-z-score"
+    alpha_constructors = {
+        signal.name: get_alpha_constructor(alpha_constructor_name, signal_name=signal.name)
+        for signal in signals
+    }
 
     print("Loading data...")
-    barra = pl.scan_parquet("data/barra/barra_*parquet")
-    ff3 = pl.scan_parquet("data/fama_french_factors/ff5.parquet")
-    barra_ff3_betas = pl.scan_parquet("data/barra_ff3_betas/barra_ff3_betas_*.parquet")
-
-    data = (
-        barra.join(other=ff3, on=["date"], how="left")
-        .join(other=barra_ff3_betas, on=["date", "barrid"], how="left")
-        .filter(pl.col("date").is_between(start, end))
-        .collect()
+    ff3 = scan_dataset("fama_french_factors/ff5")
+    if incremental and state_exists(STATE_NAME):
+        # Only the days after the last run, the state holds the warm-up
+        load_start = last_state_date(STATE_NAME) + dt.timedelta(days=1)
+    else:
+        # Load the warm-up of the signals' rolling windows before start
+        lookback_days = max(signal.lookback_days for signal in signals)
+        load_start = shift_trading_days("barra", start, -lookback_days)
+    barra = (
+        scan_dataset("barra", load_start, end)
+        .join(other=ff3, on=["date"], how="left", maintain_order="left")
+        .join(
+            # The idiosyncratic signals and filters read residual_ff3
+            other=scan_dataset(RESIDUALS, load_start, end),
+            on=["date", "barrid"],
+            how="left",
+            maintain_order="left",
+        )
     )
 
-    for signal_name in signal_names:
-        signal = get_signal(signal_name, id_col="barrid")
+    data = select_declared_columns(
+        align_asof(barra, "barra_ff3_betas", load_start, end),
+        [
+            *signals,
+            *(filter_ for own in filters.values() for filter_ in own),
+            *alpha_constructors.values(),
+        ],
+    ).collect()
 
-        alpha_constructor_name = "cross-sectional-z-score"
-        alpha_constructor = get_alpha_constructor(
-            alpha_constructor_name, signal_name=signal_name
+    if incremental and state_exists(STATE_NAME):
+        data, state = advance_signal_state(STATE_NAME, data, signals, id_col="barrid")
+        append = True
+    else:
+        data = cached_signals(
+            data,
+            signals,
+            ["barra", "fama_french_factors/ff5", "barra_ff3_betas", RESIDUALS],
+            start,
+            end,
         )
+        state = init_signal_state(data, signals, id_col="barrid")
+        append = False
 
-        print("Constructing signals...")
-        signals = construct_signals(data=data, signal=signal)
-
-        print("Applying filters...")
-        filtered = apply_filters(signals=signals, filters=filters)
+    print("Constructing signals and applying filters...")
+    for signal, filtered in construct_filtered_signals(data, signals, filters):
+        signal_name = signal.name
+        alpha_constructor = alpha_constructors[signal_name]
+        filtered = filtered.filter(pl.col("date").is_between(start, end))
 
         print("Constructing alphas...")
         alphas = construct_alphas(filtered, alpha_constructor=alpha_constructor).select(
@@ -50,9 +106,11 @@ def alphas_flow(start: dt.date, end: dt.date):
         )
 
         print("Saving alphas...")
-        output_path = Path(f"data/alphas/{signal_name}")
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        alphas.write_parquet(output_path.with_suffix(".parquet"))
+        write_dataset(alphas, f"alphas/{signal_name}", append=append)
+
+    # Only once every alpha is written, a failed run is repeated from the old state
+    if not state.is_empty():
+        save_state(STATE_NAME, state, signals, id_col="barrid")
 
 if __name__ == '__main__':
-    alphas_flow(dt.date(1995, 7, 31), dt.date(2024, 12, 31))
\ No newline at end of file
+    alphas_flow(dt.date(1995, 7, 31), dt.date(2024, 12, 31), incremental="--incremental" in sys.argv)
\ No newline at end of file
@@ -1,37 +1,48 @@
 import datetime as dt
-from pathlib import Path
 
 import polars as pl
-import sf_quant.data as sfd
-from tqdm import tqdm
-
-
-def barra_history_flow(start: dt.date, end: dt.date) -> None:
-    data = sfd.load_assets(
-        start=start,
-        end=end,
-        columns=[
-            "date",
-            "barrid",
-            "ticker",
-            "price",
-            "return",
-            "predicted_beta",
-            "specific_risk",
-            "market_cap",
-        ],
-        in_universe=True,
-    ).with_columns(pl.col("return", "specific_risk").truediv(100))
-
-    years = list(range(start.year, end.year + 1))
-
-    for year in tqdm(years, "Loading Barra daily data"):
-        file_path = Path(f"data/barra/barra_{year}.parquet")
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-
-        year_start = dt.date(year, 1, 1) if year > start.year else start
-        year_end = dt.date(year, 12, 31) if year < end.year else end
-
-        year_data = data.filter(pl.col("date").is_between(year_start, year_end))
-
-        year_data.write_parquet(file_path)
+
+from research.data import synthetic
+from research.data.ingestion import stream_chunks, year_chunks
+from research.data.query_cache import cached_query
+from research.storage import write_dataset
+
+
+def load_barra_chunk(start: dt.date, end: dt.date) -> pl.DataFrame:
+    columns = [
+        "date",
+        "barrid",
+        "ticker",
+        "price",
+        "return",
+        "predicted_beta",
+        "specific_risk",
+        "market_cap",
+    ]
+    if synthetic.enabled():
+        data = synthetic.load_assets(start=start, end=end, columns=columns, in_universe=True)
+    else:
+        # Synthetic runs do not need sf_quant installed or configured
+        import sf_quant.data as sfd
+
+        data = cached_query(
+            sfd.load_assets, start=start, end=end, columns=columns, in_universe=True
+        )
+
+    return data.with_columns(pl.col("return", "specific_risk").truediv(100))
+
+
+def write_barra_chunk(start: dt.date, end: dt.date, data: pl.DataFrame) -> None:
+    write_dataset(data, "barra")
+
+
+def barra_history_flow(
+    start: dt.date, end: dt.date, years_per_chunk: int = 1, max_workers: int = 2
+) -> None:
+    stream_chunks(
+        chunks=year_chunks(start, end, years_per_chunk),
+        load=load_barra_chunk,
+        write=write_barra_chunk,
+        desc="Loading Barra daily data",
+        max_workers=max_workers,
+    )
@@ -0,0 +1,387 @@
+import datetime as dt
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import polars as pl
+from tqdm import tqdm
+
+from research.factor_models import beta_columns, get_factor_model
+from research.regressions import rolling_ols_models
+from research.storage import (
+    clear_dataset,
+    dataset_exists,
+    read_metadata,
+    scan_dataset,
+    write_dataset,
+)
+
+WINDOW = 36 * 21
+N_SHARDS = 32
+CHUNK_SIZE = 1_000_000
+SHARD_BOUNDS_KEY = "shard_bounds"
+
+# Serializes the flows that hand a thread count to spawned workers
+WORKER_ENVIRONMENT_LOCK = threading.Lock()
+
+
+def is_new_row() -> pl.Expr:
+    return pl.col("last_date").is_null() | pl.col("date").gt(pl.col("last_date"))
+
+
+def last_computed_dates(dataset: str, id_col: str) -> pl.DataFrame | None:
+    """Last date already written for each asset, None if nothing has been written."""
+    if not dataset_exists(dataset):
+        return None
+
+    return (
+        scan_dataset(dataset)
+        .select(id_col, "date")
+        .group_by(id_col)
+        .agg(pl.col("date").max().alias("last_date"))
+        .collect()
+    )
+
+
+def warm_up_start(
+    source: str,
+    id_col: str,
+    last_dates: pl.DataFrame,
+    start: dt.date,
+    end: dt.date,
+    window: int,
+    in_shard: pl.Expr | None = None,
+) -> dt.date | None:
+    """Earliest date needed to extend every asset past its last computed date.
+
+    Each new row needs the window - 1 rows before it, so only the id and date
+    columns of the source history are scanned to locate that warm-up span,
+    restricted to the in_shard predicate when one is given.
+    Returns None when no asset has new rows.
+    """
+    scan = scan_dataset(source, start, end).select(id_col, "date")
+    if in_shard is not None:
+        scan = scan.filter(in_shard)
+
+    return (
+        scan.sort(id_col, "date")
+        .with_columns(
+            pl.col("date")
+            .shift(window - 1)
+            .over(id_col)
+            .fill_null(pl.col("date").min().over(id_col))
+            .alias("warm_up_date")
+        )
+        .join(last_dates.lazy(), on=id_col, how="left")
+        .filter(is_new_row())
+        .select(pl.col("warm_up_date").min())
+        .collect()
+        .item()
+    )
+
+
+def drop_computed_rows(
+    data: pl.DataFrame, last_dates: pl.DataFrame, id_col: str
+) -> pl.DataFrame:
+    return (
+        data.join(last_dates, on=id_col, how="left")
+        .filter(is_new_row())
+        .drop("last_date")
+    )
+
+
+def betas_dataset(name: str, model: str, window: int = WINDOW) -> str:
+    """Dataset name for one (model, window), e.g. crsp_ff3_betas or crsp_ff5_betas_252."""
+    dataset = f"{name}_{model}_betas"
+    return dataset if window == WINDOW else f"{dataset}_{window}"
+
+
+def shard_bounds(rows_per_id: pl.DataFrame, id_col: str, n_shards: int) -> list:
+    """First id of each of up to n_shards contiguous id ranges with similar row counts.
+
+    Data files are sorted by id, so a shard's id range is pruned by row group
+    statistics instead of every row group being scanned for a list of ids.
+    """
+    n_rows = pl.col("n_rows")
+    return (
+        rows_per_id.sort(id_col)
+        .with_columns(
+            (n_rows.cum_sum() - n_rows).mul(n_shards).floordiv(n_rows.sum()).alias("shard")
+        )
+        .unique("shard", keep="first", maintain_order=True)[id_col]
+        .to_list()
+    )
+
+
+def shard_of(ids: pl.Series, bounds: list) -> pl.Series:
+    """Shard of each id given the first id of every shard. Lower ids fall in the first."""
+    shards = pl.Series(bounds, dtype=ids.dtype).search_sorted(ids, side="right")
+    return (shards.cast(pl.Int64) - 1).clip(lower_bound=0).alias("shard")
+
+
+def shard_filter(id_col: str, bounds: list, shard: int) -> pl.Expr:
+    """Predicate selecting the ids of one shard."""
+    predicate = pl.lit(True)
+    if shard > 0:
+        predicate = predicate & pl.col(id_col).ge(bounds[shard])
+    if shard < len(bounds) - 1:
+        predicate = predicate & pl.col(id_col).lt(bounds[shard + 1])
+    return predicate
+
+
+def shard_bytes(n_rows: int, n_regressors: int, n_outputs: int) -> int:
+    """Rough peak memory of estimating one shard with rolling_ols_models."""
+    k = n_regressors + 1
+    inputs = n_rows * 8 * (2 * n_regressors + 8)
+    outputs = n_rows * 8 * n_outputs * (k + 2)
+    prefix_sums = min(n_rows, CHUNK_SIZE) * 8 * 3 * (k * k + k + 1)
+    return inputs + outputs + prefix_sums
+
+
+@contextmanager
+def worker_threads(n_threads: int):
+    """Give spawned workers n_threads polars threads while the block runs.
+
+    Polars sizes its thread pool when it is imported, which in a spawned
+    worker happens before any pool initializer runs, so the count can only be
+    passed through the environment the workers start with. The variable is
+    set and restored under a lock so concurrent flows cannot interleave.
+    """
+    with WORKER_ENVIRONMENT_LOCK:
+        previous = os.environ.get("POLARS_MAX_THREADS")
+        os.environ["POLARS_MAX_THREADS"] = str(n_threads)
+        try:
+            yield
+        finally:
+            if previous is None:
+                os.environ.pop("POLARS_MAX_THREADS", None)
+            else:
+                os.environ["POLARS_MAX_THREADS"] = previous
+
+
+def estimate_shard(
+    shard: int,
+    bounds: list,
+    name: str,
+    source: str,
+    id_col: str,
+    start: dt.date,
+    end: dt.date,
+    models: list[str],
+    windows: list[int],
+    output_dates: list[dt.date] | None,
+    last_dates: dict[tuple[str, int], pl.DataFrame | None],
+) -> int:
+    """Estimate and write every (model, window) for the assets of one shard.
+
+    Returns the number of rows written.
+    """
+    in_shard = shard_filter(id_col, bounds, shard)
+    outputs = {
+        (model, window): betas_dataset(name, model, window)
+        for model in models
+        for window in windows
+    }
+
+    load_start = start
+    if last_dates and all(dates is not None for dates in last_dates.values()):
+        warm_up_starts = [
+            warm_up_start(source, id_col, dates, start, end, window, in_shard=in_shard)
+            for (_, window), dates in last_dates.items()
+        ]
+        warm_up_starts = [date for date in warm_up_starts if date is not None]
+
+        if not warm_up_starts:
+            return 0
+
+        load_start = min(warm_up_starts)
+
+    factor_models = {model: get_factor_model(model) for model in models}
+
+    df_source = (
+        scan_dataset(source, load_start, end)
+        .select(id_col, "date", "return")
+        .filter(in_shard)
+        .collect()
+        .sort(id_col, "date")
+    )
+
+    df_factors = scan_dataset("fama_french_factors/ff5").collect()
+
+    df_merge = (
+        df_source.join(other=df_factors, on="date", how="left")
+        .with_columns(pl.col("return").sub("rf").alias("return_rf"))
+        .sort(id_col, "date")
+    )
+
+    coefficients = rolling_ols_models(
+        data=df_merge,
+        id_col=id_col,
+        y="return_rf",
+        models={model: factor_models[model].factors for model in models},
+        windows=windows,
+        output_dates=output_dates,
+        chunk_size=CHUNK_SIZE,
+    )
+
+    n_written = 0
+    for (model, window), dataset in outputs.items():
+        factor_model = factor_models[model]
+        df_clean = coefficients[(model, window)].rename(
+            {"const": "alpha"}
+            | dict(zip(factor_model.factors, beta_columns(factor_model)))
+        )
+
+        dates = last_dates.get((model, window))
+        if dates is not None:
+            df_clean = drop_computed_rows(df_clean, dates, id_col)
+
+        write_dataset(
+            df_clean,
+            dataset,
+            part=shard,
+            append=dates is not None,
+            metadata={SHARD_BOUNDS_KEY: json.dumps(bounds)},
+        )
+        n_written += len(df_clean)
+
+    return n_written
+
+
+def factor_betas_flow(
+    name: str,
+    source: str,
+    id_col: str,
+    start: dt.date,
+    end: dt.date,
+    models: list[str],
+    windows: list[int],
+    output_dates: list[dt.date] | None = None,
+    incremental: bool = False,
+    n_shards: int = N_SHARDS,
+    n_workers: int | None = None,
+    memory_budget_gb: float = 32.0,
+) -> None:
+    """Estimate rolling betas for several factor models and windows in one pass.
+
+    Assets are split into n_shards contiguous id ranges that run on a process
+    pool. Each worker reads only its shard's rows and columns and writes
+    straight into data/{betas_dataset(name, model, window)} as one part file
+    per year partition and shard. The pool is shrunk so that the estimated
+    peak memory of the running shards stays under memory_budget_gb, and
+    n_shards is raised when even one shard would not fit.
+
+    Incremental runs only extend each asset past its last written date. They
+    reuse the id ranges stored with the betas, so every asset keeps appending
+    to the same part files, load the warm-up rows the longest window needs and
+    rewrite just the affected years.
+    """
+    outputs = {
+        (model, window): betas_dataset(name, model, window)
+        for model in models
+        for window in windows
+    }
+
+    last_dates = {}
+    stored_bounds = None
+    if incremental:
+        last_dates = {
+            key: last_computed_dates(dataset, id_col)
+            for key, dataset in outputs.items()
+        }
+        existing = [outputs[key] for key, dates in last_dates.items() if dates is not None]
+        if existing:
+            stored_bounds = read_metadata(existing[0]).get(SHARD_BOUNDS_KEY)
+            if stored_bounds is None:
+                print(f"{name} betas predate id range shards, rebuilding them.")
+                last_dates = {}
+
+    if not last_dates:
+        for dataset in outputs.values():
+            clear_dataset(dataset)
+
+    rows_per_id = (
+        scan_dataset(source, start, end)
+        .select(id_col)
+        .group_by(id_col)
+        .agg(pl.len().alias("n_rows"))
+        .collect()
+    )
+
+    if rows_per_id.is_empty():
+        print(f"No {name} data between {start} and {end}.")
+        return
+
+    n_regressors = len({x for model in models for x in get_factor_model(model).factors})
+    budget_bytes = memory_budget_gb * 1024**3
+
+    while True:
+        if stored_bounds is None:
+            bounds = shard_bounds(rows_per_id, id_col, n_shards)
+        else:
+            bounds = json.loads(stored_bounds)
+
+        shard_rows = rows_per_id.group_by(shard_of(rows_per_id[id_col], bounds)).agg(
+            pl.col("n_rows").sum()
+        )
+        peak_bytes = shard_bytes(shard_rows["n_rows"].max(), n_regressors, len(outputs))
+        if peak_bytes <= budget_bytes:
+            break
+
+        if stored_bounds is not None or len(bounds) == len(rows_per_id):
+            raise ValueError(
+                f"Largest {name} shard needs ~{peak_bytes / 1024**3:.1f} GB, above the "
+                f"{memory_budget_gb} GB budget."
+            )
+        n_shards *= 2
+
+    budget_workers = int(budget_bytes // peak_bytes)
+    shards = sorted(shard_rows["shard"].to_list())
+
+    if n_workers is None:
+        n_workers = int(os.environ.get("SLURM_NTASKS", os.cpu_count()))
+    n_workers = max(1, min(n_workers, budget_workers, len(shards)))
+
+    # Spawned workers inherit the environment, so split the cores between them
+    print(f"Computing model coefficients on {n_workers} workers...")
+    with worker_threads(max(1, (os.cpu_count() or 1) // n_workers)):
+        with ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    estimate_shard,
+                    shard=shard,
+                    bounds=bounds,
+                    name=name,
+                    source=source,
+                    id_col=id_col,
+                    start=start,
+                    end=end,
+                    models=models,
+                    windows=windows,
+                    output_dates=output_dates,
+                    last_dates={
+                        key: None
+                        if dates is None
+                        else dates.filter(shard_filter(id_col, bounds, shard))
+                        for key, dates in last_dates.items()
+                    },
+                )
+                for shard in shards
+            ]
+
+            n_written = sum(
+                future.result()
+                for future in tqdm(
+                    as_completed(futures),
+                    total=len(futures),
+                    desc=f"Writing {name} betas",
+                )
+            )
+
+    if incremental and n_written == 0:
+        print(f"{name} betas are up to date.")
@@ -0,0 +1,42 @@
+import sys
+
+from research.storage import DATA_DIR, compact_dataset
+
+
+def find_datasets() -> list[str]:
+    """Names of every dataset under data/, in either the old or the new layout."""
+    names = set()
+    for path in DATA_DIR.rglob("*.parquet"):
+        relative = path.relative_to(DATA_DIR)
+        if relative.parts[0].startswith("."):
+            continue
+
+        directory = relative.parent
+        if path.name.startswith("part-"):
+            # data/crsp/year=2020/part-0.parquet -> crsp
+            if directory.name.startswith("year="):
+                directory = directory.parent
+            names.add(directory.as_posix())
+        elif path.stem.startswith(f"{directory.name}_"):
+            # data/crsp/crsp_2020.parquet -> crsp
+            names.add(directory.as_posix())
+        else:
+            # data/fama_french_factors/ff5.parquet -> fama_french_factors/ff5
+            names.add((directory / path.stem).as_posix())
+
+    return sorted(names)
+
+
+def compact_flow(names: list[str] | None = None) -> None:
+    """Rewrite datasets as sorted year partitions, one file per partition.
+
+    Run once to migrate data written before the partitioned layout, and after
+    sharded or incremental writers have left several part files per year.
+    """
+    for name in names or find_datasets():
+        print(f"Compacting data/{name}...")
+        compact_dataset(name)
+
+
+if __name__ == '__main__':
+    compact_flow(sys.argv[1:])
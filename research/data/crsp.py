@@ -1,31 +1,40 @@
 import datetime as dt
-from pathlib import Path
 
 import polars as pl
-import sf_quant.data as sfd
-from tqdm import tqdm
-
-
-def crsp_history_flow(start: dt.date, end: dt.date) -> None:
-    data = (
-        sfd.load_crsp_daily(
-            start=start,
-            end=end,
-            columns=["date", "permno", "ticker", "prc", "ret", "shrout"],
-        )
-        .rename({"prc": "price", "ret": "return", "shrout": "shares"})
+
+from research.data import synthetic
+from research.data.ingestion import stream_chunks, year_chunks
+from research.data.query_cache import cached_query
+from research.storage import write_dataset
+
+
+def load_crsp_chunk(start: dt.date, end: dt.date) -> pl.DataFrame:
+    columns = ["date", "permno", "ticker", "prc", "ret", "shrout"]
+    if synthetic.enabled():
+        data = synthetic.load_crsp_daily(start=start, end=end, columns=columns)
+    else:
+        # Synthetic runs do not need sf_quant installed or configured
+        import sf_quant.data as sfd
+
+        data = cached_query(sfd.load_crsp_daily, start=start, end=end, columns=columns)
+
+    return (
+        data.rename({"prc": "price", "ret": "return", "shrout": "shares"})
         .with_columns(pl.col("shares").mul(pl.col("price")).alias("market_cap"))
     )
 
-    years = list(range(start.year, end.year + 1))
-
-    for year in tqdm(years, "Loading CRSP daily data"):
-        file_path = Path(f"data/crsp/crsp_{year}.parquet")
-        file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        year_start = dt.date(year, 1, 1) if year > start.year else start
-        year_end = dt.date(year, 12, 31) if year < end.year else end
+def write_crsp_chunk(start: dt.date, end: dt.date, data: pl.DataFrame) -> None:
+    write_dataset(data, "crsp")
 
-        year_data = data.filter(pl.col("date").is_between(year_start, year_end))
 
-        year_data.write_parquet(file_path)
+def crsp_history_flow(
+    start: dt.date, end: dt.date, years_per_chunk: int = 1, max_workers: int = 2
+) -> None:
+    stream_chunks(
+        chunks=year_chunks(start, end, years_per_chunk),
+        load=load_crsp_chunk,
+        write=write_crsp_chunk,
+        desc="Loading CRSP daily data",
+        max_workers=max_workers,
+    )
@@ -1,8 +1,8 @@
 import polars as pl
 import datetime as dt
-import statsmodels.formula.api as smf
-from tqdm import tqdm
-from pathlib import Path
+
+from research.regressions import expanding_ols
+from research.storage import scan_dataset, write_dataset
 
 # Constants
 LAMBDA = 1
@@ -12,11 +12,11 @@ MONTHLY_DAYS = 21
 def load_market_data(start: dt.date, end: dt.date) -> pl.DataFrame:
     """Load and prepare market data with bear indicator and interaction term."""
     return (
-        pl.scan_parquet("data/fama_french_factors/ff3.parquet")
+        scan_dataset("fama_french_factors/ff3")
         .join(
-            pl.scan_parquet(
-                "data/momentum_factor_returns/momentum_factor_returns.parquet"
-            ).select("date", pl.col("mom").alias("r_mom")),
+            scan_dataset("momentum_factor_returns/momentum_factor_returns").select(
+                "date", pl.col("mom").alias("r_mom")
+            ),
             on="date",
             how="left",
         )
@@ -57,33 +57,36 @@ def get_month_dates(market_data: pl.DataFrame) -> list:
     )
 
 
-def estimate_coefficients(data: pl.DataFrame) -> dict[str, None | float]:
-    """Estimate regression coefficients for dynamic momentum strategy."""
-    data = data.drop_nulls().with_columns(pl.col('bear_indicator').mul('rmrf_variance').alias('interaction'))
-
-    if len(data) == 0:
-        return {"gamma_0": None, "gamma_1": None}
-
-    model = smf.ols(formula="r_mom ~ interaction", data=data)
-    results = model.fit()
-
-    return {
-        "gamma_0": results.params["Intercept"],
-        "gamma_1": results.params["interaction"],
-    }
-
-
 def calculate_rolling_coefficients(
-    market_data: pl.DataFrame, month_dates: list
+    market_data: pl.DataFrame, month_dates: list, windows: list[int] | None = None
 ) -> pl.DataFrame:
-    """Calculate rolling regression coefficients for each month."""
-    coefficients_list = []
-    for month_date in tqdm(month_dates, desc="Computing coefficients"):
-        regression_data = market_data.filter(pl.col("date").le(month_date))
-        coefficients = estimate_coefficients(regression_data)
-        coefficients_list.append({"date": month_date} | coefficients)
+    """Regression coefficients of the dynamic momentum strategy for each month.
+
+    gamma_0 and gamma_1 come from an expanding regression of r_mom on the
+    bear market / variance interaction up to each month-end. Each rolling
+    window (in trading days) adds gamma_0_{window} and gamma_1_{window}.
+    """
+    data = market_data.sort("date").with_columns(
+        pl.col("bear_indicator").mul("rmrf_variance").alias("interaction")
+    )
 
-    return pl.DataFrame(coefficients_list)
+    results = expanding_ols(
+        data=data,
+        y="r_mom",
+        x=["interaction"],
+        output_dates=month_dates,
+        windows=[None] + (windows or []),
+    )
+
+    coefficients = pl.DataFrame({"date": month_dates}, schema={"date": pl.Date})
+    for window, result in results.items():
+        suffix = "" if window is None else f"_{window}"
+        coefficients = coefficients.with_columns(
+            result["const"].alias(f"gamma_0{suffix}"),
+            result["interaction"].alias(f"gamma_1{suffix}"),
+        )
+
+    return coefficients
 
 def dmom_coefficents_history_flow(start: dt.date, end: dt.date) -> None:
     market_data = load_market_data(start, end)
@@ -91,11 +94,5 @@ def dmom_coefficents_history_flow(start: dt.date, end: dt.date) -> None:
     month_dates = get_month_dates(market_data)
     coefficients = calculate_rolling_coefficients(market_data, month_dates)
 
-    # Create output directory
-    coefficients_path = Path("data/dmom_coefficients/dmom_coefficients.parquet")
-    market_data_path = Path("data/dmom_coefficients/market_data.parquet")
-
-    coefficients_path.parent.mkdir(parents=True, exist_ok=True)
-
-    coefficients.write_parquet(coefficients_path)
-    market_data.write_parquet(market_data_path)
\ No newline at end of file
+    write_dataset(coefficients, "dmom_coefficients/dmom_coefficients", partition_by_year=False)
+    write_dataset(market_data, "dmom_coefficients/market_data", partition_by_year=False)
\ No newline at end of file
@@ -1,27 +1,22 @@
 import io
-import urllib.request
-import zipfile
-from pathlib import Path
 
 import polars as pl
 
+from research.data.french_library import fetch_file, read_csv_lines
+from research.storage import write_dataset
 
-def fama_french_5_factors_history_flow() -> None:
-    # URL for the Fama-French 3 factors (monthly data)
-    ff_url = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_daily_CSV.zip"
 
-    # Download the zip file
-    urllib.request.urlretrieve(ff_url, "fama_french.zip")
+def fama_french_5_factors_history_flow() -> None:
+    # Zip file in the Ken French data library
+    file_name = "F-F_Research_Data_5_Factors_2x3_daily_CSV.zip"
 
-    # Extract the CSV file
-    with zipfile.ZipFile("fama_french.zip", "r") as zip_file:
-        zip_file.extractall()
+    # Download the zip file (or reuse the cached copy) and read it in memory
+    content = fetch_file(file_name)
 
     # Read the CSV file with polars
     # Skip first 4 rows (header info) and read only the monthly data
     # The file has annual data after the monthly data, which we'll exclude
-    with open("F-F_Research_Data_5_Factors_2x3_daily.csv", "r") as f:
-        lines = f.readlines()
+    lines = read_csv_lines(content)
 
     # Find where monthly data ends (when we hit empty line or "Annual" section)
     monthly_end_idx = None
@@ -53,13 +48,5 @@ def fama_french_5_factors_history_flow() -> None:
         ]
     )
 
-    # Create output directory
-    file_path = Path("data/fama_french_factors/ff5.parquet")
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-
     # Save to parquet
-    data.write_parquet(file_path)
-
-    # Clean up downloaded files
-    Path("fama_french.zip").unlink(missing_ok=True)
-    Path("F-F_Research_Data_5_Factors_2x3_daily.csv").unlink(missing_ok=True)
+    write_dataset(data, "fama_french_factors/ff5", partition_by_year=False)
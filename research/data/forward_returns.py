@@ -0,0 +1,65 @@
+import sys
+
+import polars as pl
+from tqdm import tqdm
+
+from research.data.betas import N_SHARDS, shard_bounds, shard_filter
+from research.returns import (
+    HORIZONS,
+    SOURCES,
+    forward_returns,
+    forward_returns_dataset,
+)
+from research.storage import (
+    dataset_exists,
+    dataset_version,
+    read_metadata,
+    scan_dataset,
+    staged_dataset,
+    write_dataset,
+)
+
+
+def forward_returns_flow(
+    source: str, horizons: list[int] = HORIZONS, n_shards: int = N_SHARDS
+) -> None:
+    """Materialize the forward returns of a return source as data/forward_returns/{source}.
+
+    Forward returns are computed once per asset over its full history, in
+    contiguous id ranges, and stored like any other dataset: year partitions
+    sorted by (id, date), so readers prune dates by partition and ids by row
+    group statistics. Rebuilding is skipped until the source returns (or the
+    horizons) change.
+    """
+    id_col = SOURCES[source]
+    dataset = forward_returns_dataset(source)
+    version = dataset_version([source]) + ":" + ",".join(str(h) for h in horizons)
+    if dataset_exists(dataset) and read_metadata(dataset).get("version") == version:
+        print(f"{dataset} is up to date.")
+        return
+
+    rows_per_id = (
+        scan_dataset(source).group_by(id_col).agg(pl.len().alias("n_rows")).collect()
+    )
+    bounds = shard_bounds(rows_per_id, id_col, n_shards)
+
+    with staged_dataset(dataset):
+        for shard in tqdm(range(len(bounds)), desc=f"Building {dataset}"):
+            data = (
+                scan_dataset(source)
+                .select("date", id_col, "return")
+                .filter(shard_filter(id_col, bounds, shard))
+                .collect()
+            )
+            write_dataset(
+                forward_returns(data, id_col, horizons),
+                dataset,
+                part=shard,
+                metadata={"version": version},
+                staged=True,
+            )
+
+
+if __name__ == '__main__':
+    for source_name in sys.argv[1:] or SOURCES:
+        forward_returns_flow(source_name)
@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import urllib.error
+import urllib.request
+import zipfile
+from pathlib import Path
+
+from research.data import synthetic
+from research.storage import DATA_DIR
+
+BASE_URL = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp"
+CACHE_DIR = DATA_DIR / ".cache" / "french_library"
+
+# Point at a directory holding copies of the library's zip files to run offline
+MIRROR_ENV = "FRENCH_LIBRARY_MIRROR"
+
+
+def cached_request(file_name: str) -> urllib.request.Request:
+    """GET request for a library file, conditional on the cached copy's validators."""
+    request = urllib.request.Request(f"{BASE_URL}/{file_name}")
+    meta_path = CACHE_DIR / f"{file_name}.json"
+    if meta_path.exists() and (CACHE_DIR / file_name).exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+    return request
+
+
+def fetch_file(file_name: str, mirror: str | None = None) -> bytes:
+    """Contents of one zip file from the Ken French data library.
+
+    Files are read from the mirror directory when one is given (or set in
+    FRENCH_LIBRARY_MIRROR). Otherwise the download is cached under
+    data/.cache/french_library with its ETag and Last-Modified headers. Later
+    runs revalidate with a conditional GET and reuse the cached bytes on 304.
+    With RESEARCH_SYNTHETIC_DATA=1 the synthetic provider generates the file.
+    """
+    if synthetic.enabled():
+        return synthetic.french_library_file(file_name)
+
+    mirror = mirror or os.environ.get(MIRROR_ENV)
+    if mirror:
+        return (Path(mirror) / file_name).read_bytes()
+
+    cache_path = CACHE_DIR / file_name
+    try:
+        with urllib.request.urlopen(cached_request(file_name)) as response:
+            content = response.read()
+            meta = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+    except urllib.error.HTTPError as error:
+        if error.code != 304:
+            raise
+        return cache_path.read_bytes()
+
+    # The validators are dropped first and each file is replaced whole, so an
+    # interrupted write never pairs new bytes with old validators or vice versa
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    meta_path = CACHE_DIR / f"{file_name}.json"
+    meta_path.unlink(missing_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(cache_path)
+    tmp_path = meta_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(meta))
+    tmp_path.replace(meta_path)
+    return content
+
+
+def read_csv_lines(content: bytes) -> list[str]:
+    """Lines of the CSV file inside a library zip, without touching the disk."""
+    with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+        (member,) = zip_file.namelist()
+        with io.TextIOWrapper(zip_file.open(member), errors="replace") as file:
+            return file.readlines()
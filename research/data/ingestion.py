@@ -0,0 +1,52 @@
+import datetime as dt
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from tqdm import tqdm
+
+
+def year_chunks(
+    start: dt.date, end: dt.date, years_per_chunk: int = 1
+) -> list[tuple[dt.date, dt.date]]:
+    """Split [start, end] into consecutive ranges of whole calendar years."""
+    chunks = []
+    for year in range(start.year, end.year + 1, years_per_chunk):
+        chunk_start = dt.date(year, 1, 1) if year > start.year else start
+        last_year = year + years_per_chunk - 1
+        chunk_end = dt.date(last_year, 12, 31) if last_year < end.year else end
+        chunks.append((chunk_start, chunk_end))
+    return chunks
+
+
+def stream_chunks(
+    chunks: list[tuple[dt.date, dt.date]],
+    load: Callable[[dt.date, dt.date], pl.DataFrame],
+    write: Callable[[dt.date, dt.date, pl.DataFrame], None],
+    desc: str,
+    max_workers: int = 2,
+) -> None:
+    """Load chunks on a small thread pool while earlier chunks are written.
+
+    At most max_workers chunks are in flight while one is being written, so peak
+    memory is bounded by a few chunks instead of the full history.
+    """
+    remaining = iter(chunks)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for chunk in remaining:
+            pending.append((chunk, executor.submit(load, *chunk)))
+            if len(pending) == max_workers:
+                break
+
+        for _ in tqdm(range(len(chunks)), desc):
+            (chunk_start, chunk_end), future = pending.popleft()
+            data = future.result()
+
+            next_chunk = next(remaining, None)
+            if next_chunk is not None:
+                pending.append((next_chunk, executor.submit(load, *next_chunk)))
+
+            write(chunk_start, chunk_end, data)
+            del data
@@ -1,27 +1,22 @@
 import io
-import urllib.request
-import zipfile
-from pathlib import Path
 
 import polars as pl
 
+from research.data.french_library import fetch_file, read_csv_lines
+from research.storage import write_dataset
 
-def momentum_factor_returns_flow() -> None:
-    # URL for the Fama-French 3 factors (monthly data)
-    mom_url = "https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/6_Portfolios_ME_Prior_12_2_Daily_CSV.zip"
 
-    # Download the zip file
-    urllib.request.urlretrieve(mom_url, "fama_french.zip")
+def momentum_factor_returns_flow() -> None:
+    # Zip file in the Ken French data library
+    file_name = "6_Portfolios_ME_Prior_12_2_Daily_CSV.zip"
 
-    # Extract the CSV file
-    with zipfile.ZipFile("fama_french.zip", "r") as zip_file:
-        zip_file.extractall()
+    # Download the zip file (or reuse the cached copy) and read it in memory
+    content = fetch_file(file_name)
 
     # Read the CSV file with polars
     # Skip first 4 rows (header info) and read only the monthly data
     # The file has annual data after the monthly data, which we'll exclude
-    with open("6_Portfolios_ME_Prior_12_2_Daily.csv", "r") as f:
-        lines = f.readlines()
+    lines = read_csv_lines(content)
 
     # Find where monthly data ends (when we hit empty line or "Annual" section)
     value_weight_end_idx = None
@@ -58,16 +53,10 @@ def momentum_factor_returns_flow() -> None:
         ).alias('mom')
     )
 
-    # Create output directory
-    file_path = Path("data/momentum_factor_returns/momentum_factor_returns.parquet")
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-
     # Save to parquet
-    data.write_parquet(file_path)
-
-    # Clean up downloaded files
-    Path("fama_french.zip").unlink(missing_ok=True)
-    Path("6_Portfolios_ME_Prior_12_2_Daily.csv").unlink(missing_ok=True)
+    write_dataset(
+        data, "momentum_factor_returns/momentum_factor_returns", partition_by_year=False
+    )
 
 if __name__ == '__main__':
     momentum_factor_returns_flow()
\ No newline at end of file
@@ -0,0 +1,314 @@
+import datetime as dt
+import sys
+from collections.abc import Iterator
+
+import polars as pl
+from tqdm import tqdm
+
+from research.alignment import align_asof
+from research.data.betas import N_SHARDS, shard_bounds, shard_filter
+from research.data.ingestion import year_chunks
+from research.filters import get_filter
+from research.models import Signal
+from research.returns import forward_returns_dataset, scan_forward_returns
+from research.signals import (
+    cached_signals,
+    construct_filtered_signals,
+    get_signal,
+    declared_columns,
+    signal_fingerprint,
+    with_signals,
+)
+from research.storage import (
+    ID_COLUMNS,
+    dataset_exists,
+    dataset_version,
+    read_metadata,
+    scan_dataset,
+    shift_trading_days,
+    staged_dataset,
+    write_dataset,
+)
+
+# Input datasets stored in each panel
+PANELS = {
+    "crsp_ff5_betas": [
+        "crsp",
+        "fama_french_factors/ff5",
+        "crsp_ff3_residuals",
+    ],
+    "crsp_dmom": [
+        "crsp",
+    ],
+}
+
+# Slow-moving datasets attached to each panel as of its dates when it is read
+ASOF_DATASETS = {
+    "crsp_ff5_betas": ["crsp_ff3_betas"],
+    "crsp_dmom": [
+        "dmom_coefficients/dmom_coefficients",
+        "dmom_coefficients/market_data",
+    ],
+}
+
+
+# Signals materialized at month-end in each monthly panel
+MONTHLY_SIGNALS = {
+    "crsp_ff5_betas": [
+        "momentum",
+        "idiosyncratic_momentum_fama_french_3",
+        "volatility_scaled_idiosyncratic_momentum_fama_french_3",
+    ],
+    "crsp_dmom": [
+        "momentum",
+        "constant_volatility_scaled_momentum",
+        "semi_volatility_scaled_momentum",
+        "dynamic_volatility_scaled_momentum",
+    ],
+}
+
+
+def panel_dataset(name: str) -> str:
+    return f"panels/{name}"
+
+
+def join_panel(name: str, start: dt.date, end: dt.date) -> pl.LazyFrame:
+    """CRSP joined with the daily date- and asset-level data of one panel.
+
+    Returns, factor returns and residuals are joined by exact date. The
+    slow-moving ASOF_DATASETS are not stored, scan_panel attaches them.
+    """
+    crsp = scan_dataset("crsp", start, end)
+
+    match name:
+        case "crsp_ff5_betas":
+            return crsp.join(
+                other=scan_dataset("fama_french_factors/ff5", start, end),
+                on="date",
+                how="left",
+                maintain_order="left",
+            ).join(
+                other=scan_dataset("crsp_ff3_residuals", start, end),
+                on=["date", "permno"],
+                how="left",
+                maintain_order="left",
+            )
+        case "crsp_dmom":
+            return crsp
+        case _:
+            raise ValueError(f"Panel not implemented: {name}")
+
+
+def asof_columns(name: str) -> list[str]:
+    """Columns a slow-moving dataset adds to the panel rows it is aligned to."""
+    return [
+        col
+        for col in scan_dataset(name).collect_schema().names()
+        if col not in ["date", *ID_COLUMNS]
+    ]
+
+
+def panel_flow(name: str, start: dt.date, end: dt.date) -> None:
+    """Materialize a joined analysis panel as data/panels/{name}.
+
+    The panel is built one year at a time and stored like any other dataset:
+    year partitions sorted by (permno, date). Each file records the version of
+    the inputs it was built from, so rebuilding is skipped until an input
+    dataset (or the date range) changes.
+    """
+    if name not in PANELS:
+        raise ValueError(f"Panel not implemented: {name}")
+
+    dataset = panel_dataset(name)
+    version = dataset_version(PANELS[name]) + f":{start}:{end}"
+    if dataset_exists(dataset) and read_metadata(dataset).get("version") == version:
+        print(f"{dataset} is up to date.")
+        return
+
+    with staged_dataset(dataset):
+        chunks = tqdm(year_chunks(start, end), desc=f"Building {dataset}")
+        for chunk_start, chunk_end in chunks:
+            data = join_panel(name, chunk_start, chunk_end).collect()
+            write_dataset(data, dataset, metadata={"version": version}, staged=True)
+
+
+def month_end_dates(data: pl.LazyFrame) -> pl.LazyFrame:
+    """Last trading date of each month."""
+    return (
+        data.select("date")
+        .unique()
+        .group_by(pl.col("date").dt.strftime("%Y%m").alias("year_month"))
+        .agg(pl.col("date").max())
+        .select("date")
+    )
+
+
+def monthly_panel_flow(
+    name: str, start: dt.date, end: dt.date, n_shards: int = N_SHARDS
+) -> None:
+    """Materialize data/panels/{name}_monthly from a daily panel.
+
+    Keeps one row per (permno, month-end) with the month-end values of every
+    daily column, the return over the month (monthly_return, read from the
+    stored "month" forward returns of the month before) and
+    the month-end value of each of the panel's MONTHLY_SIGNALS. Signals are
+    computed on the full daily history, so monthly-rebalance studies can
+    filter, sort and weight ~21x fewer rows with the same results. Assets are
+    processed in contiguous permno ranges to bound memory. Like the daily
+    panel, it does not store the ASOF_DATASETS columns the signals read. The
+    panel is rebuilt when its inputs or the definition of a signal change.
+    """
+    daily_dataset = panel_dataset(name)
+    dataset = panel_dataset(f"{name}_monthly")
+    signals = [get_signal(signal_name, id_col="permno") for signal_name in MONTHLY_SIGNALS[name]]
+    version = ":".join(
+        [
+            dataset_version([daily_dataset, *ASOF_DATASETS[name], forward_returns_dataset("crsp")]),
+            str(start),
+            str(end),
+        ]
+        + [signal_fingerprint(signal, []) for signal in signals]
+    )
+    if dataset_exists(dataset) and read_metadata(dataset).get("version") == version:
+        print(f"{dataset} is up to date.")
+        return
+
+    month_ends = month_end_dates(scan_dataset(daily_dataset, start, end)).collect()
+
+    rows_per_id = (
+        scan_dataset(daily_dataset, start, end)
+        .group_by("permno")
+        .agg(pl.len().alias("n_rows"))
+        .collect()
+    )
+    bounds = shard_bounds(rows_per_id, "permno", n_shards)
+    aligned = [col for other in ASOF_DATASETS[name] for col in asof_columns(other)]
+
+    month = pl.col("date").dt.month_start().alias("month")
+
+    with staged_dataset(dataset):
+        for shard in tqdm(range(len(bounds)), desc=f"Building {dataset}"):
+            in_shard = shard_filter("permno", bounds, shard)
+            # The forward month return of the month before is this month's return
+            monthly_returns = (
+                scan_forward_returns("crsp", "month", start - dt.timedelta(days=31), end)
+                .filter(in_shard)
+                .group_by("permno", month.dt.offset_by("1mo"))
+                .agg(pl.col("fwd_return").last().alias("monthly_return"))
+            )
+            data = (
+                scan_panel(name, start, end)
+                .filter(in_shard)
+                .pipe(with_signals, signals)
+                .drop(aligned)
+                .join(month_ends.lazy(), on="date", how="semi", maintain_order="left")
+                .with_columns(month)
+                .join(monthly_returns, on=["permno", "month"], how="left", maintain_order="left")
+                .drop("month")
+                .collect()
+            )
+            write_dataset(data, dataset, part=shard, metadata={"version": version}, staged=True)
+
+
+def scan_panel(
+    name: str,
+    start: dt.date | None = None,
+    end: dt.date | None = None,
+    columns: list[str] | None = None,
+    lookback_days: int = 0,
+) -> pl.LazyFrame:
+    """Lazily scan a materialized panel with date and column pushdown.
+
+    The panel's slow-moving ASOF_DATASETS are attached to each row as of its
+    date through align_asof, which reads only the scanned range of them.
+    When columns are given, only those of the panel are kept and a dataset
+    providing none of them is not joined at all. The scan also covers
+    lookback_days trading days before start, the warm-up of rolling signals.
+    Trim to [start, end] once they are computed. It does not reach past end:
+    forward returns are stored per horizon by research.returns, so join them
+    from scan_forward_returns over [start, end] instead.
+    """
+    dataset = panel_dataset(name)
+    if not dataset_exists(dataset):
+        raise FileNotFoundError(
+            f"{dataset} has not been built, "
+            f"run `python research/data/panels.py {name.removesuffix('_monthly')}`."
+        )
+
+    if start is not None:
+        start = shift_trading_days(dataset, start, -lookback_days)
+
+    scan = scan_dataset(dataset, start, end)
+    for other in ASOF_DATASETS[name.removesuffix("_monthly")]:
+        if columns is None or set(columns) & set(asof_columns(other)):
+            scan = align_asof(scan, other, start, end)
+
+    if columns is not None:
+        names = scan.collect_schema().names()
+        scan = scan.select(col for col in names if col in columns)
+    return scan
+
+
+def filtered_panel_signals(
+    name: str,
+    signal_names: list[str],
+    filter_names: list[str],
+    start: dt.date,
+    end: dt.date,
+    monthly: bool = False,
+    extra: list[str] | None = None,
+) -> Iterator[tuple[Signal, pl.DataFrame]]:
+    """Load a panel once and yield each signal with its filtered rows in [start, end].
+
+    Monthly studies read {name}_monthly, whose signals were computed on the
+    full daily history, and raise a ValueError for a signal it does not
+    store. Daily studies read the daily panel from the warm-up the signals
+    need and take the signals from the signal cache. Either way
+    only the columns the signals and filters declare, plus extra (e.g. the
+    weighting columns), are read. Every filter in filter_names applies to
+    every signal.
+    """
+    panel = f"{name}_monthly" if monthly else name
+    signals = [get_signal(signal_name, id_col="permno") for signal_name in signal_names]
+    lookback_days = 0 if monthly else max(signal.lookback_days for signal in signals)
+    filters = {
+        signal.name: [
+            get_filter(filter_name, signal_name=signal.name, monthly=monthly)
+            for filter_name in filter_names
+        ]
+        for signal in signals
+    }
+
+    items = [*signals, *(filter_ for own in filters.values() for filter_ in own)]
+    scan = scan_panel(
+        panel,
+        start,
+        end,
+        columns=declared_columns(items, extra),
+        lookback_days=lookback_days,
+    )
+    if monthly:
+        # Computing a signal over month-end rows would silently give other values
+        missing = [
+            signal.name for signal in signals if signal.name not in scan.collect_schema()
+        ]
+        if missing:
+            raise ValueError(
+                f"{panel} does not store {missing}. Add them to MONTHLY_SIGNALS and "
+                "rebuild it, or rebalance daily."
+            )
+
+    data = cached_signals(
+        scan.collect(), signals, [panel_dataset(panel), *ASOF_DATASETS[name]], start, end
+    )
+
+    return (
+        (signal, filtered.filter(pl.col("date").is_between(start, end)))
+        for signal, filtered in construct_filtered_signals(data, signals, filters)
+    )
+
+
+if __name__ == '__main__':
+    for panel_name in sys.argv[1:] or PANELS:
+        panel_flow(panel_name, dt.date(1963, 7, 31), dt.date(2024, 12, 31))
+        monthly_panel_flow(panel_name, dt.date(1963, 7, 31), dt.date(2024, 12, 31))
@@ -0,0 +1,185 @@
+import hashlib
+import inspect
+import json
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from research.models import Stage
+from research.storage import DATA_DIR, dataset_dir, dataset_exists
+
+STATE_FILE = DATA_DIR / ".pipeline" / "state.json"
+RESEARCH_DIR = Path(__file__).resolve().parents[1]
+BLOCK_SIZE = 1024 * 1024
+
+
+def load_state() -> dict:
+    if not STATE_FILE.exists():
+        return {"files": {}, "stages": {}}
+    return json.loads(STATE_FILE.read_text())
+
+
+def save_state(state: dict) -> None:
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    state["files"] = {
+        path: entry for path, entry in state["files"].items() if Path(path).exists()
+    }
+    tmp_path = STATE_FILE.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    tmp_path.replace(STATE_FILE)
+
+
+def file_digest(path: Path, files: dict) -> str:
+    """Content hash of a file, reused while its size and mtime are unchanged."""
+    stat = path.stat()
+    entry = files.get(str(path))
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        while block := file.read(BLOCK_SIZE):
+            digest.update(block)
+
+    files[str(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def dataset_hash(name: str, files: dict) -> str:
+    digest = hashlib.blake2b()
+    for path in sorted(dataset_dir(name).rglob("*.parquet")):
+        digest.update(str(path.relative_to(DATA_DIR)).encode())
+        digest.update(file_digest(path, files).encode())
+    return digest.hexdigest()
+
+
+def source_files(flow) -> list[Path]:
+    """Files of the research modules a flow depends on, following imports."""
+    seen = set()
+    stack = [sys.modules[flow.__module__]]
+    while stack:
+        module = stack.pop()
+        file_name = getattr(module, "__file__", None)
+        if file_name is None:
+            continue
+
+        path = Path(file_name).resolve()
+        if path in seen or not path.is_relative_to(RESEARCH_DIR):
+            continue
+        seen.add(path)
+
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                stack.append(value)
+            elif (name := getattr(value, "__module__", None)) in sys.modules:
+                stack.append(sys.modules[name])
+
+    return sorted(seen)
+
+
+def stage_key(stage: Stage, files: dict) -> str:
+    """Hash of a stage's code, arguments and input datasets."""
+    digest = hashlib.blake2b()
+    for path in source_files(stage.flow):
+        digest.update(path.read_bytes())
+    digest.update(repr(sorted(stage.kwargs.items())).encode())
+    for name in sorted(stage.inputs):
+        digest.update(name.encode())
+        digest.update(dataset_hash(name, files).encode())
+    return digest.hexdigest()
+
+
+def stage_dependencies(stages: list[Stage]) -> dict[str, set[str]]:
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(
+                    f"{output} is written by both {producers[output]} and {stage.name}"
+                )
+            producers[output] = stage.name
+
+    return {
+        stage.name: {producers[name] for name in stage.inputs if name in producers}
+        for stage in stages
+    }
+
+
+def run_pipeline(stages: list[Stage], max_workers: int = 4, force: bool = False) -> None:
+    """Run stages as a DAG, skipping those whose inputs and code are unchanged.
+
+    A stage depends on every stage that writes one of its inputs. Independent
+    stages run concurrently on a thread pool, except that stages with their
+    own process pool run one at a time so they do not split the cores and
+    memory between pools sized for the whole machine. A stage is skipped when the hash
+    of its source files, arguments and input datasets matches the last
+    successful run and its outputs exist. Stages without inputs read external
+    sources (WRDS, the French library), so they always run. Downstream stages
+    are still skipped when those sources come back unchanged.
+    """
+    dependencies = stage_dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state()
+
+    pending = set(by_name)
+    done, failed = set(), set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = sorted(name for name in pending if dependencies[name] <= done | failed)
+            for name in ready:
+                stage = by_name[name]
+                pool_busy = any(by_name[other].process_pool for other, _ in running.values())
+                if stage.process_pool and pool_busy:
+                    continue
+                pending.remove(name)
+
+                if dependencies[name] & failed:
+                    print(f"Skipping {name}: an upstream stage failed.")
+                    failed.add(name)
+                    continue
+
+                key = stage_key(stage, state["files"])
+                outputs_exist = all(dataset_exists(output) for output in stage.outputs)
+                if (
+                    not force
+                    and stage.inputs
+                    and outputs_exist
+                    and state["stages"].get(name) == key
+                ):
+                    print(f"{name} is up to date.")
+                    done.add(name)
+                    continue
+
+                print(f"Running {name}...")
+                running[executor.submit(stage.flow, **stage.kwargs)] = (name, key)
+
+            if not running:
+                if not pending:
+                    break
+                # Skipped stages can make others ready without anything running
+                if not any(dependencies[name] <= done | failed for name in pending):
+                    raise ValueError(f"Stages form a cycle: {sorted(pending)}")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                try:
+                    future.result()
+                except Exception as error:
+                    print(f"{name} failed:")
+                    traceback.print_exception(error)
+                    failed.add(name)
+                    continue
+
+                state["stages"][name] = key
+                save_state(state)
+                done.add(name)
+
+    save_state(state)
+
+    if failed:
+        raise RuntimeError(f"Pipeline stages failed: {sorted(failed)}")
@@ -0,0 +1,161 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+
+import polars as pl
+
+from research.storage import DATA_DIR, evict
+
+CACHE_DIR = DATA_DIR / ".cache" / "queries"
+INDEX_FILE = CACHE_DIR / "index.json"
+
+# Set RESEARCH_QUERY_CACHE=0 to always query the source
+CACHE_ENV = "RESEARCH_QUERY_CACHE"
+
+# Disk quota of the cache in GB, least recently used results are evicted first
+QUOTA_ENV = "RESEARCH_QUERY_CACHE_GB"
+DEFAULT_QUOTA_GB = 50.0
+
+# Results older than this many days are fetched again, picking up restated history
+MAX_AGE_ENV = "RESEARCH_QUERY_CACHE_DAYS"
+DEFAULT_MAX_AGE_DAYS = 30
+
+# The most recent days can still be revised, ranges reaching them are not cached
+SETTLE_DAYS = 7
+
+# Chunk loaders run on threads and share the index
+INDEX_LOCK = threading.Lock()
+
+
+def load_index() -> list[dict]:
+    if not INDEX_FILE.exists():
+        return []
+    entries = json.loads(INDEX_FILE.read_text())
+    return [entry for entry in entries if (CACHE_DIR / entry["file"]).exists()]
+
+
+def save_index(entries: list[dict]) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = INDEX_FILE.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(entries, indent=2))
+    tmp_path.replace(INDEX_FILE)
+
+
+def normalize_query(
+    loader: Callable, start: dt.date, end: dt.date, columns: list[str], params: dict
+) -> dict:
+    """Canonical form of a query: the loader, its extra arguments, the range and the column set."""
+    return {
+        "loader": f"{loader.__module__}.{loader.__name__}",
+        "params": json.dumps(params, sort_keys=True, default=str),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "columns": sorted(set(columns)),
+    }
+
+
+def covers(entry: dict, query: dict) -> bool:
+    """Whether a cached result holds every row and column of the query."""
+    if entry["loader"] != query["loader"] or entry["params"] != query["params"]:
+        return False
+    if not set(query["columns"]) <= set(entry["columns"]):
+        return False
+    if (entry["start"], entry["end"]) == (query["start"], query["end"]):
+        return True
+    # Sub-ranges are cut out of the cached rows by date
+    return (
+        "date" in entry["columns"]
+        and entry["start"] <= query["start"]
+        and entry["end"] >= query["end"]
+    )
+
+
+def is_fresh(entry: dict, today: dt.date) -> bool:
+    """Whether a cached result was fetched recently enough to be served."""
+    max_age = dt.timedelta(days=float(os.environ.get(MAX_AGE_ENV, DEFAULT_MAX_AGE_DAYS)))
+    fetched = entry.get("fetched")
+    return fetched is not None and today - dt.date.fromisoformat(fetched) <= max_age
+
+
+def is_settled(end: dt.date, today: dt.date) -> bool:
+    """Whether a range ends early enough that its rows are no longer being revised."""
+    return end < today - dt.timedelta(days=SETTLE_DAYS)
+
+
+def cached_query(
+    loader: Callable,
+    start: dt.date,
+    end: dt.date,
+    columns: list[str],
+    **params,
+) -> pl.DataFrame:
+    """Call a sf_quant.data loader through a local parquet cache of its results.
+
+    Results are keyed by the normalized query and stored under
+    data/.cache/queries. A query is served from any cached result of the same
+    loader and arguments that covers its date range and columns, so
+    sub-ranges and column subsets never reach the source. New results replace
+    the entries they cover, and the least recently used results are evicted
+    once the cache exceeds RESEARCH_QUERY_CACHE_GB.
+
+    Results expire RESEARCH_QUERY_CACHE_DAYS after they were fetched, so
+    restated history reaches the cache within that time. Ranges that end
+    within SETTLE_DAYS of today are always queried and never cached, because
+    their last days may still be revised.
+    """
+    if os.environ.get(CACHE_ENV, "1") == "0":
+        return loader(start=start, end=end, columns=columns, **params)
+
+    today = dt.date.today()
+    if not is_settled(end, today):
+        return loader(start=start, end=end, columns=columns, **params)
+
+    query = normalize_query(loader, start, end, columns, params)
+
+    with INDEX_LOCK:
+        entries = load_index()
+        hits = [
+            entry for entry in entries if is_fresh(entry, today) and covers(entry, query)
+        ]
+        if hits:
+            entry = min(hits, key=lambda entry: entry["size"])
+            entry["last_used"] = time.time()
+            save_index(entries)
+
+            data = pl.scan_parquet(CACHE_DIR / entry["file"])
+            if (entry["start"], entry["end"]) != (query["start"], query["end"]):
+                data = data.filter(pl.col("date").is_between(start, end))
+            return data.select(columns).collect()
+
+    data = loader(start=start, end=end, columns=columns, **params)
+
+    file_name = hashlib.blake2b(json.dumps(query).encode(), digest_size=16).hexdigest()
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = CACHE_DIR / f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    data.write_parquet(tmp_path)
+    tmp_path.replace(CACHE_DIR / f"{file_name}.parquet")
+
+    entry = query | {
+        "file": f"{file_name}.parquet",
+        "size": (CACHE_DIR / f"{file_name}.parquet").stat().st_size,
+        "last_used": time.time(),
+        "fetched": today.isoformat(),
+    }
+    quota_bytes = float(os.environ.get(QUOTA_ENV, DEFAULT_QUOTA_GB)) * 1024**3
+
+    with INDEX_LOCK:
+        entries = [entry]
+        for other in load_index():
+            if other["file"] == entry["file"]:
+                continue
+            if covers(entry, other) or not is_fresh(other, today):
+                (CACHE_DIR / other["file"]).unlink(missing_ok=True)
+            else:
+                entries.append(other)
+        save_index(evict(entries, quota_bytes, CACHE_DIR))
+
+    return data
@@ -0,0 +1,82 @@
+import datetime as dt
+import sys
+
+import polars as pl
+from tqdm import tqdm
+
+from research.data.betas import betas_dataset
+from research.data.ingestion import year_chunks
+from research.factor_models import get_factor_model, residual
+from research.storage import (
+    dataset_exists,
+    dataset_version,
+    read_metadata,
+    scan_dataset,
+    staged_dataset,
+    write_dataset,
+)
+
+FACTORS = "fama_french_factors/ff5"
+
+
+def residuals_dataset(name: str, model: str) -> str:
+    """Dataset name for one model's residuals, e.g. crsp_ff3_residuals."""
+    return f"{name}_{model}_residuals"
+
+
+def factor_residuals_flow(
+    name: str,
+    source: str,
+    id_col: str,
+    start: dt.date,
+    end: dt.date,
+    models: list[str],
+) -> None:
+    """Materialize daily residual returns of each factor model next to its betas.
+
+    Writes data/{name}_{model}_residuals with one residual_{model} column per
+    (date, id) of the source, from the same-day betas in
+    data/{name}_{model}_betas and the FF5 factor returns. Each dataset records
+    the version of its inputs and is rebuilt only when they change.
+    """
+    for model in models:
+        factor_model = get_factor_model(model)
+        betas = betas_dataset(name, model)
+        dataset = residuals_dataset(name, model)
+        version = dataset_version([source, FACTORS, betas]) + f":{start}:{end}"
+        if dataset_exists(dataset) and read_metadata(dataset).get("version") == version:
+            print(f"{dataset} is up to date.")
+            continue
+
+        with staged_dataset(dataset):
+            chunks = tqdm(year_chunks(start, end), desc=f"Building {dataset}")
+            for chunk_start, chunk_end in chunks:
+                data = (
+                    scan_dataset(source, chunk_start, chunk_end)
+                    .select("date", id_col, "return")
+                    .join(
+                        other=scan_dataset(FACTORS, chunk_start, chunk_end),
+                        on="date",
+                        how="left",
+                        maintain_order="left",
+                    )
+                    .join(
+                        other=scan_dataset(betas, chunk_start, chunk_end),
+                        on=["date", id_col],
+                        how="left",
+                        maintain_order="left",
+                    )
+                    .select("date", id_col, residual(factor_model))
+                    .collect()
+                )
+                write_dataset(data, dataset, metadata={"version": version}, staged=True)
+
+if __name__ == '__main__':
+    factor_residuals_flow(
+        name="crsp",
+        source="crsp",
+        id_col="permno",
+        start=dt.date(1963, 7, 31),
+        end=dt.date(2024, 12, 31),
+        models=sys.argv[1:] or ["ff3"],
+    )
@@ -0,0 +1,300 @@
+import datetime as dt
+import functools
+import io
+import os
+import string
+import zipfile
+
+import numpy as np
+import polars as pl
+
+# Set RESEARCH_SYNTHETIC_DATA=1 to replace sf_quant.data and the French library
+SYNTHETIC_ENV = "RESEARCH_SYNTHETIC_DATA"
+SEED_ENV = "RESEARCH_SYNTHETIC_SEED"
+ASSETS_ENV = "RESEARCH_SYNTHETIC_ASSETS"
+YEARS_ENV = "RESEARCH_SYNTHETIC_YEARS"
+
+DEFAULT_ASSETS = 500
+DEFAULT_YEARS = 100
+
+# Last simulated date, past the pipeline's end so forward returns exist
+END = dt.date(2025, 6, 30)
+
+# First dates of the French library files
+FF3_START = dt.date(1926, 7, 1)
+FF5_START = dt.date(1963, 7, 1)
+MOMENTUM_START = dt.date(1926, 11, 3)
+
+
+def enabled() -> bool:
+    return os.environ.get(SYNTHETIC_ENV, "0") == "1"
+
+
+def settings() -> tuple[int, int, int]:
+    """Seed, number of asset slots and years of history."""
+    return (
+        int(os.environ.get(SEED_ENV, 0)),
+        int(os.environ.get(ASSETS_ENV, DEFAULT_ASSETS)),
+        int(os.environ.get(YEARS_ENV, DEFAULT_YEARS)),
+    )
+
+
+def t_draws(rng: np.random.Generator, df: int, size) -> np.ndarray:
+    """Student-t draws scaled to unit variance."""
+    return rng.standard_t(df, size=size) * np.sqrt((df - 2) / df)
+
+
+@functools.cache
+def trading_days(seed: int, years: int) -> np.ndarray:
+    """Weekdays of the simulated history, less a few random market holidays."""
+    days = np.arange(
+        np.datetime64(dt.date(END.year - years, 1, 1)),
+        np.datetime64(END) + 1,
+        dtype="datetime64[D]",
+    )
+    holidays = np.random.default_rng([seed, 0]).random(len(days)) < 0.035
+    return days[np.is_busday(days) & ~holidays]
+
+
+@functools.cache
+def factor_returns(seed: int, years: int) -> pl.DataFrame:
+    """Daily factor returns with persistent volatility regimes and fat tails."""
+    days = trading_days(seed, years)
+    n_days = len(days)
+    rng = np.random.default_rng([seed, 1])
+
+    log_vol = np.zeros(n_days)
+    shocks = rng.normal(0, 0.08, n_days)
+    for i in range(1, n_days):
+        log_vol[i] = 0.985 * log_vol[i - 1] + shocks[i]
+    vol = np.exp(log_vol)
+
+    draws = t_draws(rng, 4, (n_days, 6))
+    rf = 0.00015 + 0.0001 * np.sin(np.arange(n_days) / 2000)
+
+    return pl.DataFrame(
+        {
+            "date": days,
+            "mkt_rf": 0.0003 + 0.009 * vol * draws[:, 0],
+            "smb": 0.0001 + 0.005 * draws[:, 1],
+            "hml": 0.00015 + 0.005 * draws[:, 2],
+            "rmw": 0.0001 + 0.004 * draws[:, 3],
+            "cma": 0.0001 + 0.004 * draws[:, 4],
+            "umd": 0.0003 + 0.006 * vol * draws[:, 5],
+            "rf": rf.round(6),
+            "vol": vol,
+        }
+    ).with_columns(pl.col("date").cast(pl.Date))
+
+
+@functools.cache
+def listings(seed: int, n_assets: int, years: int) -> pl.DataFrame:
+    """Listing spans and characteristics of every firm.
+
+    Each asset slot holds a sequence of firms: when one delists, another lists
+    after a gap, so the cross-section churns at a roughly constant size.
+    """
+    n_days = len(trading_days(seed, years))
+    rng = np.random.default_rng([seed, 2])
+
+    spans = []
+    for _ in range(n_assets):
+        first = 0 if rng.random() < 0.7 else int(rng.integers(0, 2520))
+        while first < n_days:
+            life = max(252, int(rng.exponential(252 * 12)))
+            last = min(first + life, n_days) - 1
+            spans.append((first, last))
+            first = last + 1 + int(rng.integers(5, 120))
+
+    n_firms = len(spans)
+    letters = np.array(list(string.ascii_uppercase))
+    return pl.DataFrame(
+        {
+            "permno": np.arange(10000, 10000 + n_firms),
+            "ticker": ["".join(rng.choice(letters, 4)) for _ in range(n_firms)],
+            "first": [first for first, _ in spans],
+            "last": [last for _, last in spans],
+            "alpha": rng.normal(0, 0.0002, n_firms),
+            "beta_mkt": rng.normal(1.0, 0.4, n_firms),
+            "beta_smb": rng.normal(0.3, 0.6, n_firms),
+            "beta_hml": rng.normal(0.1, 0.6, n_firms),
+            "beta_rmw": rng.normal(0.0, 0.3, n_firms),
+            "beta_cma": rng.normal(0.0, 0.3, n_firms),
+            "beta_umd": rng.normal(0.0, 0.3, n_firms),
+            "sigma": rng.lognormal(np.log(0.02), 0.4, n_firms),
+            "price": rng.lognormal(3, 1, n_firms),
+            "shares": rng.lognormal(9, 1.5, n_firms),
+        }
+    )
+
+
+def firm_panel(start: dt.date, end: dt.date) -> pl.DataFrame:
+    """Daily prices, returns and shares of the firms listed in [start, end].
+
+    Each firm's path is drawn from its own seeded generator over its whole
+    listing, so any date range returns the same rows. A few firm-days are
+    missing at random.
+    """
+    seed, n_assets, years = settings()
+    days = trading_days(seed, years)
+    factors = factor_returns(seed, years)
+    lo = int(np.searchsorted(days, np.datetime64(start)))
+    hi = int(np.searchsorted(days, np.datetime64(end), side="right"))
+
+    firms = listings(seed, n_assets, years).filter(
+        pl.col("first").lt(hi), pl.col("last").ge(lo)
+    )
+    factor_names = ["mkt_rf", "smb", "hml", "rmw", "cma", "umd"]
+    factor_values = factors.select(factor_names).to_numpy()
+    rf, vol = factors["rf"].to_numpy(), factors["vol"].to_numpy()
+
+    pieces = []
+    for firm in firms.iter_rows(named=True):
+        first, last = firm["first"], firm["last"] + 1
+        rng = np.random.default_rng([seed, 3, firm["permno"]])
+        n_days = last - first
+
+        loadings = np.array(
+            [firm[f"beta_{name.removesuffix('_rf')}"] for name in factor_names]
+        )
+        idio = firm["sigma"] * np.sqrt(vol[first:last]) * t_draws(rng, 3, n_days)
+        returns = np.maximum(
+            firm["alpha"] + rf[first:last] + factor_values[first:last] @ loadings + idio,
+            -0.9,
+        )
+        share_changes = np.where(rng.random(n_days) < 0.004, rng.normal(0, 0.1, n_days), 0)
+        missing = rng.random(n_days) < 0.002
+
+        window = slice(max(lo, first) - first, min(hi, last) - first)
+        keep = ~missing[window]
+        pieces.append(
+            pl.DataFrame(
+                {
+                    "date": days[first:last][window][keep],
+                    "permno": np.full(keep.sum(), firm["permno"]),
+                    "ticker": np.full(keep.sum(), firm["ticker"]),
+                    "price": (firm["price"] * np.exp(np.cumsum(np.log1p(returns))))[window][keep],
+                    "return": returns[window][keep],
+                    "shares": (firm["shares"] * np.exp(np.cumsum(share_changes)))[window][keep],
+                    "predicted_beta": np.full(keep.sum(), firm["beta_mkt"]),
+                    "specific_risk": np.full(keep.sum(), firm["sigma"] * np.sqrt(252)),
+                }
+            )
+        )
+
+    if not pieces:
+        return pl.DataFrame(
+            schema={
+                "date": pl.Date,
+                "permno": pl.Int64,
+                "ticker": pl.String,
+                "price": pl.Float64,
+                "return": pl.Float64,
+                "shares": pl.Float64,
+                "predicted_beta": pl.Float64,
+                "specific_risk": pl.Float64,
+            }
+        )
+    return pl.concat(pieces).with_columns(pl.col("date").cast(pl.Date)).sort("date", "permno")
+
+
+def load_crsp_daily(start: dt.date, end: dt.date, columns: list[str]) -> pl.DataFrame:
+    """Synthetic stand-in for sf_quant.data.load_crsp_daily."""
+    return firm_panel(start, end).select(
+        "date",
+        "permno",
+        "ticker",
+        pl.col("price").alias("prc"),
+        pl.col("return").alias("ret"),
+        pl.col("shares").alias("shrout"),
+    ).select(columns)
+
+
+def load_assets(
+    start: dt.date, end: dt.date, columns: list[str], in_universe: bool = True
+) -> pl.DataFrame:
+    """Synthetic stand-in for sf_quant.data.load_assets.
+
+    Every synthetic firm is in the estimation universe. Returns and specific
+    risk are in percent like the Barra data.
+    """
+    return firm_panel(start, end).select(
+        "date",
+        pl.format("SYN{}", pl.col("permno")).alias("barrid"),
+        "ticker",
+        "price",
+        pl.col("return").mul(100),
+        "predicted_beta",
+        pl.col("specific_risk").mul(100),
+        pl.col("price").mul("shares").alias("market_cap"),
+    ).select(columns)
+
+
+def library_csv(title: str, data: pl.DataFrame, header_rows: int) -> str:
+    """CSV text laid out like the French library files: notes, header, rows, copyright."""
+    notes = [f"This file was created by the synthetic data provider: {title}"]
+    notes += [""] * (header_rows - 1)
+    columns = data.columns[1:]
+    lines = notes + ["," + ",".join(columns)]
+    # Percent returns with two decimals, the risk-free rate with three
+    formats = ["{:9.3f}" if column == "RF" else "{:8.2f}" for column in columns]
+    for date, *values in data.iter_rows():
+        lines.append(
+            date.strftime("%Y%m%d")
+            + ","
+            + ",".join(fmt.format(value * 100) for fmt, value in zip(formats, values))
+        )
+    lines += ["", "Copyright synthetic data provider", ""]
+    return "\n".join(lines)
+
+
+def french_library_file(file_name: str) -> bytes:
+    """Synthetic stand-in for a zip file of the Ken French data library."""
+    seed, _, years = settings()
+    factors = factor_returns(seed, years)
+    market = pl.col("mkt_rf").add(pl.col("rf"))
+
+    match file_name:
+        case "F-F_Research_Data_Factors_daily_CSV.zip":
+            data = factors.filter(pl.col("date").ge(FF3_START)).select(
+                "date",
+                pl.col("mkt_rf").alias("Mkt-RF"),
+                pl.col("smb").alias("SMB"),
+                pl.col("hml").alias("HML"),
+                pl.col("rf").alias("RF"),
+            )
+            text = library_csv("Fama/French 3 Factors", data, header_rows=3)
+        case "F-F_Research_Data_5_Factors_2x3_daily_CSV.zip":
+            data = factors.filter(pl.col("date").ge(FF5_START)).select(
+                "date",
+                pl.col("mkt_rf").alias("Mkt-RF"),
+                pl.col("smb").alias("SMB"),
+                pl.col("hml").alias("HML"),
+                pl.col("rmw").alias("RMW"),
+                pl.col("cma").alias("CMA"),
+                pl.col("rf").alias("RF"),
+            )
+            text = library_csv("Fama/French 5 Factors (2x3)", data, header_rows=3)
+        case "6_Portfolios_ME_Prior_12_2_Daily_CSV.zip":
+            small = market.add(pl.col("smb"))
+            data = factors.filter(pl.col("date").ge(MOMENTUM_START)).select(
+                "date",
+                small.sub(pl.col("umd").truediv(2)).alias("SMALL LoPRIOR"),
+                small.alias("ME1 PRIOR2"),
+                small.add(pl.col("umd").truediv(2)).alias("SMALL HiPRIOR"),
+                market.sub(pl.col("umd").truediv(2)).alias("BIG LoPRIOR"),
+                market.alias("ME2 PRIOR2"),
+                market.add(pl.col("umd").truediv(2)).alias("BIG HiPRIOR"),
+            )
+            text = library_csv(
+                "6 Portfolios Formed on Size and Momentum -- Average Value Weighted Returns",
+                data,
+                header_rows=11,
+            )
+        case _:
+            raise FileNotFoundError(f"No synthetic version of {file_name}")
+
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(file_name.removesuffix("_CSV.zip") + ".csv", text)
+    return content.getvalue()
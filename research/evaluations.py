@@ -8,6 +8,8 @@ import seaborn as sns
 import statsmodels.formula.api as smf
 import great_tables as gt
 
+from research.storage import scan_dataset
+
 pl.Config.set_tbl_rows(n=11)
 pl.Config.set_tbl_cols(n=10)
 
@@ -22,7 +24,7 @@ def create_quantile_summary_table(
     end: dt.date,
     title: str,
 ) -> pl.DataFrame:
-    factors = pl.read_parquet("data/fama_french_factors/ff5.parquet")
+    factors = scan_dataset("fama_french_factors/ff5").collect()
 
     annual_factor = 1
 
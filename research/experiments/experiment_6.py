@@ -1,12 +1,13 @@
 import polars as pl
 import datetime as dt
-import statsmodels.formula.api as smf
-from tqdm import tqdm
 import seaborn as sns
 import matplotlib.pyplot as plt
 from pathlib import Path
 import great_tables as gt
 
+from research.data.dmom_coefficients import calculate_rolling_coefficients
+from research.storage import scan_dataset
+
 # Constants
 START_DATE = dt.date(2018, 1, 1)
 END_DATE = dt.date(2024, 12, 31)
@@ -16,10 +17,10 @@ LOOKBACK_DAYS = 126
 MONTHLY_DAYS = 21
 
 
-def load_month_end_dates(parquet_path: str) -> pl.DataFrame:
+def load_month_end_dates(dataset: str) -> pl.DataFrame:
     """Extract month-end dates from momentum factor returns."""
     return (
-        pl.scan_parquet(parquet_path)
+        scan_dataset(dataset)
         .with_columns(pl.col("date").dt.strftime("%Y%m").alias("year_month"))
         .group_by("year_month")
         .agg(pl.col("date").max())
@@ -29,13 +30,11 @@ def load_month_end_dates(parquet_path: str) -> pl.DataFrame:
 
 
 def load_daily_momentum_returns(
-    parquet_path: str, start: dt.date, end: dt.date
+    dataset: str, start: dt.date, end: dt.date
 ) -> pl.DataFrame:
     """Load and filter daily momentum returns."""
     return (
-        pl.scan_parquet(parquet_path)
-        .filter(pl.col("date").is_between(start, end))
-        .sort("date")
+        scan_dataset(dataset, start, end)
         .select("date", pl.col("mom").alias("return"))
         .collect()
     )
@@ -131,11 +130,11 @@ def calculate_smom_strategy(
 def load_market_data(start: dt.date, end: dt.date) -> pl.DataFrame:
     """Load and prepare market data with bear indicator and interaction term."""
     return (
-        pl.scan_parquet("data/fama_french_factors/ff3.parquet")
+        scan_dataset("fama_french_factors/ff3")
         .join(
-            pl.scan_parquet(
-                "data/momentum_factor_returns/momentum_factor_returns.parquet"
-            ).select("date", pl.col("mom").alias("r_mom")),
+            scan_dataset("momentum_factor_returns/momentum_factor_returns").select(
+                "date", pl.col("mom").alias("r_mom")
+            ),
             on="date",
             how="left",
         )
@@ -176,35 +175,6 @@ def get_month_dates(market_data: pl.DataFrame) -> list:
     )
 
 
-def estimate_coefficients(data: pl.DataFrame) -> dict[str, None | float]:
-    """Estimate regression coefficients for dynamic momentum strategy."""
-    data = data.drop_nulls().with_columns(pl.col('bear_indicator').mul('rmrf_variance').alias('interaction'))
-
-    if len(data) == 0:
-        return {"gamma_0": None, "gamma_1": None}
-
-    model = smf.ols(formula="r_mom ~ interaction", data=data)
-    results = model.fit()
-
-    return {
-        "gamma_0": results.params["Intercept"],
-        "gamma_1": results.params["interaction"],
-    }
-
-
-def calculate_rolling_coefficients(
-    market_data: pl.DataFrame, month_dates: list
-) -> pl.DataFrame:
-    """Calculate rolling regression coefficients for each month."""
-    coefficients_list = []
-    for month_date in tqdm(month_dates, desc="Computing coefficients"):
-        regression_data = market_data.filter(pl.col("date").le(month_date))
-        coefficients = estimate_coefficients(regression_data)
-        coefficients_list.append({"date": month_date} | coefficients)
-
-    return pl.DataFrame(coefficients_list)
-
-
 def calculate_dmom_strategy(
     daily_returns: pl.DataFrame,
     coefficients: pl.DataFrame,
@@ -347,10 +317,10 @@ def experiment_6():
     """Main execution function."""
     # Load data
     month_end_dates = load_month_end_dates(
-        "data/momentum_factor_returns/momentum_factor_returns.parquet"
+        "momentum_factor_returns/momentum_factor_returns"
     )
     daily_returns = load_daily_momentum_returns(
-        "data/momentum_factor_returns/momentum_factor_returns.parquet",
+        "momentum_factor_returns/momentum_factor_returns",
         START_DATE,
         END_DATE,
     )
@@ -1,8 +1,7 @@
 import polars as pl
 import datetime as dt
-from research.signals import get_signal, construct_signals
-from research.filters import get_filter, apply_filters
-from research.portfolios import construct_quantile_portfolios
+from research.portfolios import construct_quantile_portfolios, weighting_columns
+from research.data.panels import filtered_panel_signals
 from research.returns import construct_returns
 from research.evaluations import (
     create_quantile_summary_table, create_quantile_returns_chart
@@ -25,31 +24,20 @@ def experiment_7():
     ]
 
     print("Loading data...")
-    crsp = pl.scan_parquet("data/crsp/crsp_*.parquet")
-    dmom_coefficients = pl.scan_parquet("data/dmom_coefficients/dmom_coefficients.parquet")
-    market_data = pl.scan_parquet("data/dmom_coefficients/market_data.parquet")
-
-    data = (
-        crsp
-        .join(dmom_coefficients, on='date', how='left')
-        .join(market_data, on='date', how='left')
-        .filter(pl.col("date").is_between(start, end))
-        .sort("permno", "date")
-        .collect()
+    signal_rows = filtered_panel_signals(
+        "crsp_dmom",
+        signal_names,
+        filter_names,
+        start,
+        end,
+        monthly=rebalance_frequency == "monthly",
+        extra=weighting_columns(weighting_scheme),
     )
 
-    for signal_name in signal_names:
+    print("Constructing signals and applying filters...")
+    for signal, filtered in signal_rows:
+        signal_name = signal.name
         print(f"Running experiment for {signal_name}...")
-        signal = get_signal(signal_name, id_col="permno")
-
-        print("Constructing signals...")
-        signals = construct_signals(data=data, signal=signal)
-
-        print("Applying filters...")
-        filters = [
-            get_filter(filter_name, signal_name=signal_name) for filter_name in filter_names
-        ]
-        filtered = apply_filters(signals=signals, filters=filters)
 
         print("Constructing portfolios...")
         portfolios = construct_quantile_portfolios(
@@ -0,0 +1,44 @@
+import polars as pl
+
+from research.models import FactorModel
+
+
+def capm() -> FactorModel:
+    return FactorModel(name="capm", factors=["mkt_rf"])
+
+
+def fama_french_3() -> FactorModel:
+    return FactorModel(name="ff3", factors=["mkt_rf", "smb", "hml"])
+
+
+def fama_french_5() -> FactorModel:
+    return FactorModel(name="ff5", factors=["mkt_rf", "smb", "hml", "rmw", "cma"])
+
+
+def beta_columns(model: FactorModel) -> list[str]:
+    """Beta column names for a model, e.g. mkt_rf -> beta_mkt."""
+    return [f"beta_{factor.removesuffix('_rf')}" for factor in model.factors]
+
+
+def residual_column(model: FactorModel) -> str:
+    return f"residual_{model.name}"
+
+
+def residual(model: FactorModel) -> pl.Expr:
+    """Excess return not explained by the model: return - rf - alpha - betas x factors."""
+    expr = pl.col("return").sub("rf").sub(pl.col("alpha"))
+    for factor, beta in zip(model.factors, beta_columns(model)):
+        expr = expr.sub(pl.col(beta).mul(factor))
+    return expr.alias(residual_column(model))
+
+
+def get_factor_model(name: str) -> FactorModel:
+    match name:
+        case "capm":
+            return capm()
+        case "ff3":
+            return fama_french_3()
+        case "ff5":
+            return fama_french_5()
+        case _:
+            raise ValueError(f"{name} not implemented")
@@ -1,6 +1,11 @@
 import polars as pl
 
 from research.models import Filter
+from research.signals import (
+    IDIOSYNCRATIC_MOMENTUM,
+    IDIOSYNCRATIC_VOLATILITY,
+    idiosyncratic_momentum_terms,
+)
 
 
 def penny_stocks() -> Filter:
@@ -19,7 +24,9 @@ def micro_caps() -> Filter:
 
 def null_signal(signal_name: str) -> Filter:
     return Filter(
-        name=null_signal.__name__, expr=pl.col(signal_name).is_not_null(), columns=[]
+        name=null_signal.__name__,
+        expr=pl.col(signal_name).is_not_null(),
+        columns=[signal_name],
     )
 
 
@@ -29,35 +36,26 @@ def low_price_stocks() -> Filter:
     )
 
 
-def null_idiosyncratic_momentum() -> Filter:
-    residual = (
-        pl.col("return")
-        .sub("rf")
-        .sub(pl.col("alpha"))
-        .sub(pl.col("beta_mkt").mul("mkt_rf"))
-        .sub(pl.col("beta_smb").mul("smb"))
-        .sub(pl.col("beta_hml").mul("hml"))
-    )
-    idiosyncratic_momentum = (
-        residual.rolling_sum(230)
-        .truediv(residual.rolling_std(230))
-        .shift(22)
-        .over("permno")
+def null_idiosyncratic_momentum(monthly: bool = False) -> Filter:
+    if monthly:
+        # Monthly panels store the signal itself, computed on daily data
+        return Filter(
+            name=null_idiosyncratic_momentum.__name__,
+            expr=pl.col(
+                "volatility_scaled_idiosyncratic_momentum_fama_french_3"
+            ).is_not_null(),
+            columns=["volatility_scaled_idiosyncratic_momentum_fama_french_3"],
+        )
+
+    idiosyncratic_momentum = pl.col(IDIOSYNCRATIC_MOMENTUM).truediv(
+        pl.col(IDIOSYNCRATIC_VOLATILITY)
     )
 
     return Filter(
         name=null_idiosyncratic_momentum.__name__,
         expr=idiosyncratic_momentum.is_not_null(),
-        columns=[
-            "alpha",
-            "beta_mkt",
-            "beta_hml",
-            "beta_smb",
-            "mkt_rf",
-            "hml",
-            "smb",
-            "rf",
-        ],
+        columns=["residual_ff3"],
+        terms=idiosyncratic_momentum_terms("permno"),
     )
 
 
@@ -73,10 +71,19 @@ def get_filter(name: str, **kwargs) -> Filter:
         case "low-price-stocks":
             return low_price_stocks()
         case "null-idiosyncratic-momentum":
-            return null_idiosyncratic_momentum()
+            return null_idiosyncratic_momentum(monthly=kwargs.get("monthly", False))
         case _:
             raise ValueError
 
 
-def apply_filters(signals: pl.DataFrame, filters: list[Filter]) -> pl.DataFrame:
-    return signals.filter([filter_.expr for filter_ in filters])
+def apply_filters(
+    signals: pl.DataFrame | pl.LazyFrame, filters: list[Filter]
+) -> pl.DataFrame | pl.LazyFrame:
+    terms = {}
+    for filter_ in filters:
+        terms |= filter_.terms
+    return (
+        signals.with_columns(**terms)
+        .filter([filter_.expr for filter_ in filters])
+        .drop(list(terms))
+    )
@@ -1,8 +1,13 @@
 import datetime as dt
-from dataclasses import dataclass
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
 import polars as pl
-import sf_quant.optimizer.constraints
+
+if TYPE_CHECKING:
+    # Only the MVE backtests build constraints, the rest runs without sf_quant
+    import sf_quant.optimizer.constraints
 
 
 @dataclass
@@ -11,6 +16,8 @@ class Signal:
     expr: pl.Expr
     columns: list[str]
     lookback_days: int
+    # Window subexpressions expr refers to by column name, shared across signals
+    terms: dict[str, pl.Expr] = field(default_factory=dict)
 
 
 @dataclass
@@ -25,15 +32,33 @@ class Filter:
     name: str
     expr: pl.Expr
     columns: list[str]
+    terms: dict[str, pl.Expr] = field(default_factory=dict)
 
 
 @dataclass
 class Constraint:
     name: str
-    constraint: sf_quant.optimizer.constraints.Constraint
+    constraint: "sf_quant.optimizer.constraints.Constraint"
     columns: list[str]
 
 
+@dataclass
+class FactorModel:
+    name: str
+    factors: list[str]
+
+
+@dataclass
+class Stage:
+    name: str
+    flow: Callable[..., None]
+    inputs: list[str]
+    outputs: list[str]
+    kwargs: dict = field(default_factory=dict)
+    # Runs its own process pool sized to the machine, one such stage at a time
+    process_pool: bool = False
+
+
 @dataclass
 class Dataset:
     name: str
@@ -1,9 +1,13 @@
 import polars as pl
-import sf_quant.backtester as sfb
 
 from research.models import Constraint, Signal
 
 
+def weighting_columns(weighting_scheme: str) -> list[str]:
+    """Columns a weighting scheme reads besides the signal."""
+    return ["market_cap"] if weighting_scheme == "market_cap" else []
+
+
 def construct_quantile_portfolios(
     data: pl.DataFrame, n_bins: int, signal: Signal, weighting_scheme: str, drop_null: bool = True
 ) -> pl.DataFrame:
@@ -63,4 +67,6 @@ def construct_mve_portfolios(
     else:
         raise ValueError(f"Rebalance frequency not implemented: {rebalance_frequency}")
 
+    import sf_quant.backtester as sfb
+
     return sfb.backtest_parallel(data=alphas, constraints=constraints, gamma=gamma)
@@ -0,0 +1,238 @@
+import datetime as dt
+
+import numpy as np
+import polars as pl
+
+
+def _group_starts(ids: pl.Series) -> np.ndarray:
+    """Row index of the first observation of each contiguous id block."""
+    return np.flatnonzero(ids.ne(ids.shift(1)).fill_null(True).to_numpy())
+
+
+def _chunk_bounds(starts: np.ndarray, n_rows: int, chunk_size: int) -> list[tuple[int, int]]:
+    """Split rows into chunks of whole groups with roughly chunk_size rows each."""
+    bounds = []
+    chunk_start = 0
+    for group_start in starts[1:]:
+        if group_start - chunk_start >= chunk_size:
+            bounds.append((chunk_start, int(group_start)))
+            chunk_start = int(group_start)
+    bounds.append((chunk_start, n_rows))
+    return bounds
+
+
+def _prefix_sums(values: np.ndarray) -> np.ndarray:
+    """Cumulative sums along the first axis with a leading row of zeros."""
+    cumulative = np.cumsum(values, axis=0)
+    return np.concatenate([np.zeros((1,) + values.shape[1:]), cumulative])
+
+
+def _solve(xtx: np.ndarray, xty: np.ndarray) -> np.ndarray:
+    """Batched solve of many small normal equation systems."""
+    try:
+        return np.linalg.solve(xtx, xty[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return (np.linalg.pinv(xtx) @ xty[..., None])[..., 0]
+
+
+def rolling_ols_models(
+    data: pl.DataFrame,
+    id_col: str,
+    y: str,
+    models: dict[str, list[str]],
+    windows: list[int],
+    output_dates: list[dt.date] | None = None,
+    chunk_size: int = 1_000_000,
+) -> dict[tuple[str, int], pl.DataFrame]:
+    """Rolling OLS of y on several regressor sets and window lengths in one pass.
+
+    Data is assumed to have already been sorted by id_col and date. Models
+    whose regressors are missing on the same rows share cumulative X'X and X'y
+    sums, accumulated once over the union of their regressors. Each window
+    length takes one set of windowed differences, and each model solves its
+    own sub-block of those sums. Every window in a chunk of assets is solved
+    in one batched call. Like RollingOLS with min_nobs=window, a window
+    containing any missing observation of y or of the model's own regressors
+    returns nulls.
+
+    Returns a frame per (model, window) with date, id_col, "const" and one
+    coefficient column per regressor. Frames cover every row, or only the rows
+    on output_dates when those are given.
+    """
+    n_rows = len(data)
+    regressors = list(dict.fromkeys(x for factors in models.values() for x in factors))
+
+    ys = data[y].cast(pl.Float64).fill_null(np.nan).to_numpy()
+    xs = np.column_stack(
+        [np.ones(n_rows)]
+        + [data[col].cast(pl.Float64).fill_null(np.nan).to_numpy() for col in regressors]
+    )
+    finite = np.isfinite(xs)
+
+    # Models are grouped by the rows they can use, each group gets its own sums
+    groups: list[tuple[np.ndarray, list[str]]] = []
+    for name, factors in models.items():
+        columns = [0] + [regressors.index(x) + 1 for x in factors]
+        valid = np.isfinite(ys) & finite[:, columns].all(axis=1)
+        for group_valid, names in groups:
+            if np.array_equal(group_valid, valid):
+                names.append(name)
+                break
+        else:
+            groups.append((valid, [name]))
+
+    if output_dates is None:
+        output_mask = np.ones(n_rows, dtype=bool)
+    else:
+        output_mask = data["date"].is_in(output_dates).to_numpy()
+
+    starts = _group_starts(data[id_col])
+    group_start = np.repeat(starts, np.diff(np.append(starts, n_rows)))
+
+    coefficients = {
+        (name, window): np.full((n_rows, len(models[name]) + 1), np.nan)
+        for name in models
+        for window in windows
+    }
+
+    for valid, names in groups:
+        columns = [0] + [
+            regressors.index(x) + 1
+            for x in dict.fromkeys(x for name in names for x in models[name])
+        ]
+        group_xs = np.where(valid[:, None], xs[:, columns], 0.0)
+        group_ys = np.where(valid, ys, 0.0)
+        blocks = {
+            name: np.array([0] + [columns.index(regressors.index(x) + 1) for x in models[name]])
+            for name in names
+        }
+
+        for chunk_start, chunk_end in _chunk_bounds(starts, n_rows, chunk_size):
+            rows = np.arange(chunk_start, chunk_end)
+            position = rows - group_start[rows] + 1
+            if not (output_mask[rows] & (position >= min(windows))).any():
+                continue
+
+            x_chunk = group_xs[chunk_start:chunk_end]
+            y_chunk = group_ys[chunk_start:chunk_end]
+
+            cum_n = _prefix_sums(valid[chunk_start:chunk_end].astype(np.float64))
+            cum_xtx = _prefix_sums(x_chunk[:, :, None] * x_chunk[:, None, :])
+            cum_xty = _prefix_sums(x_chunk * y_chunk[:, None])
+
+            for window in windows:
+                candidates = rows[output_mask[rows] & (position >= window)]
+                upper = candidates - chunk_start + 1
+                lower = upper - window
+
+                solvable = cum_n[upper] - cum_n[lower] >= window
+                candidates = candidates[solvable]
+                upper, lower = upper[solvable], lower[solvable]
+                if len(candidates) == 0:
+                    continue
+
+                xtx = cum_xtx[upper] - cum_xtx[lower]
+                xty = cum_xty[upper] - cum_xty[lower]
+
+                for name, block in blocks.items():
+                    coefficients[(name, window)][candidates] = _solve(
+                        xtx[:, block[:, None], block], xty[:, block]
+                    )
+
+    keys = data.select("date", id_col)
+    if output_dates is not None:
+        keys = keys.filter(pl.Series(output_mask))
+
+    results = {}
+    for (name, window), values in coefficients.items():
+        if output_dates is not None:
+            values = values[output_mask]
+        results[(name, window)] = keys.with_columns(
+            pl.Series(column, values[:, i], nan_to_null=True)
+            for i, column in enumerate(["const"] + models[name])
+        )
+
+    return results
+
+
+def rolling_ols(
+    data: pl.DataFrame,
+    id_col: str,
+    y: str,
+    x: list[str],
+    window: int,
+    output_dates: list[dt.date] | None = None,
+    chunk_size: int = 1_000_000,
+) -> pl.DataFrame:
+    """Rolling OLS of y on x (plus an intercept) within each id.
+
+    Data is assumed to have already been sorted by id_col and date. Returns
+    date, id_col, "const" and one coefficient column per x.
+    """
+    return rolling_ols_models(
+        data=data,
+        id_col=id_col,
+        y=y,
+        models={"model": x},
+        windows=[window],
+        output_dates=output_dates,
+        chunk_size=chunk_size,
+    )[("model", window)]
+
+
+def expanding_ols(
+    data: pl.DataFrame,
+    y: str,
+    x: list[str],
+    output_dates: list[dt.date],
+    windows: list[int | None] | None = None,
+) -> dict[int | None, pl.DataFrame]:
+    """OLS of y on x (plus an intercept) using the rows up to each output date.
+
+    Data is assumed to have already been sorted by date. A window of None
+    regresses on every row up to the date. An integer window uses only the
+    last window rows. Rows with a missing value are dropped from each fit like
+    statsmodels' formula API, and dates whose window holds no complete row
+    return nulls. Cumulative X'X and X'y sums are accumulated once, so every
+    date and window is solved in one batched pseudo-inverse.
+
+    Returns a frame per window with date, "const" and one coefficient column
+    per x.
+    """
+    windows = windows or [None]
+    n_rows = len(data)
+
+    ys = data[y].cast(pl.Float64).fill_null(np.nan).to_numpy()
+    xs = np.column_stack(
+        [np.ones(n_rows)]
+        + [data[col].cast(pl.Float64).fill_null(np.nan).to_numpy() for col in x]
+    )
+
+    valid = np.isfinite(ys) & np.isfinite(xs).all(axis=1)
+    ys = np.where(valid, ys, 0.0)
+    xs = np.where(valid[:, None], xs, 0.0)
+
+    cum_n = _prefix_sums(valid.astype(np.float64))
+    cum_xtx = _prefix_sums(xs[:, :, None] * xs[:, None, :])
+    cum_xty = _prefix_sums(xs * ys[:, None])
+
+    dates = pl.Series("date", output_dates, dtype=pl.Date)
+    upper = np.searchsorted(
+        data["date"].to_numpy(), dates.to_numpy(), side="right"
+    )
+
+    results = {}
+    for window in windows:
+        lower = np.zeros_like(upper) if window is None else np.maximum(upper - window, 0)
+
+        xtx = cum_xtx[upper] - cum_xtx[lower]
+        xty = cum_xty[upper] - cum_xty[lower]
+        values = (np.linalg.pinv(xtx) @ xty[..., None])[..., 0]
+        values[cum_n[upper] - cum_n[lower] == 0] = np.nan
+
+        results[window] = pl.DataFrame(dates).with_columns(
+            pl.Series(column, values[:, i], nan_to_null=True)
+            for i, column in enumerate(["const"] + x)
+        )
+
+    return results
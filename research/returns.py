@@ -1,5 +1,113 @@
+import datetime as dt
+
 import polars as pl
 
+from research.storage import dataset_exists, scan_dataset, shift_trading_days
+
+# Id column of each return source
+SOURCES = {"crsp": "permno", "barra": "barrid"}
+
+# Holding periods in trading days, plus the following calendar month
+HORIZONS = [1, 5, 21, 63, "month"]
+
+
+def forward_returns_dataset(source: str) -> str:
+    return f"forward_returns/{source}"
+
+
+def forward_return_column(horizon: int | str) -> str:
+    return f"fwd_return_{horizon}"
+
+
+def forward_returns(
+    data: pl.DataFrame, id_col: str, horizons: list[int | str]
+) -> pl.DataFrame:
+    """Compounded forward returns of each asset over every horizon.
+
+    A horizon of h days is the return over the h trading days after each date,
+    null when any of them is missing like rolling_sum. "month" is the return
+    over the calendar month after each date's month, null when any return of
+    that month is missing.
+    """
+    log_return = pl.col("return").log1p()
+    month = pl.col("date").dt.month_start().alias("month")
+
+    result = data.select(
+        "date",
+        id_col,
+        *[
+            log_return.rolling_sum(window_size=horizon)
+            .shift(-horizon)
+            .exp()
+            .sub(1)
+            .over(id_col)
+            .alias(forward_return_column(horizon))
+            for horizon in horizons
+            if horizon != "month"
+        ],
+    )
+
+    if "month" in horizons:
+        next_month = (
+            data.group_by(id_col, month)
+            .agg(
+                pl.when(pl.col("return").null_count().eq(0))
+                .then(log_return.sum().exp().sub(1))
+                .alias(forward_return_column("month"))
+            )
+            .with_columns(pl.col("month").dt.offset_by("-1mo"))
+        )
+        result = (
+            result.with_columns(month)
+            .join(next_month, on=[id_col, "month"], how="left", maintain_order="left")
+            .drop("month")
+        )
+
+    return result
+
+
+def scan_forward_returns(
+    source: str,
+    horizon: int | str,
+    start: dt.date | None = None,
+    end: dt.date | None = None,
+    ids: list | pl.Series | None = None,
+) -> pl.LazyFrame:
+    """Lazily scan one horizon of forward returns as fwd_return.
+
+    Dates outside [start, end] are pruned by partition and, when ids are
+    given, other assets by row group statistics. When the horizon has not
+    been stored, it is computed from the source returns over [start, end]
+    plus the holding period, the only span those forward returns depend on.
+    """
+    id_col = SOURCES[source]
+    dataset = forward_returns_dataset(source)
+    column = forward_return_column(horizon)
+
+    if dataset_exists(dataset):
+        scan = scan_dataset(dataset, start, end)
+        if column in scan.collect_schema().names():
+            if ids is not None:
+                scan = scan.filter(pl.col(id_col).is_in(ids))
+            return scan.select("date", id_col, pl.col(column).alias("fwd_return"))
+
+    scan_end = end
+    if end is not None:
+        if horizon == "month":
+            scan_end = end + dt.timedelta(days=62)
+        else:
+            scan_end = shift_trading_days(source, end, horizon)
+
+    scan = scan_dataset(source, start, scan_end).select("date", id_col, "return")
+    if ids is not None:
+        scan = scan.filter(pl.col(id_col).is_in(ids))
+
+    data = forward_returns(scan.collect(), id_col, [horizon])
+    if end is not None:
+        data = data.filter(pl.col("date").le(end))
+    return data.select("date", id_col, pl.col(column).alias("fwd_return")).lazy()
+
+
 def construct_returns(
     data: pl.DataFrame, n_bins: int, rebalance_frequency: str
 ) -> pl.DataFrame:
@@ -11,27 +119,31 @@ def construct_returns(
         case "daily":
             holding_period = 1
         case "monthly":
-            holding_period = 21
+            # Month-end portfolios are held over the following calendar month
+            holding_period = "month"
         case _:
             raise ValueError(
                 f"Rebalance frequency not implemented: {rebalance_frequency}"
             )
 
-    forward_returns = (
-        pl.scan_parquet("data/crsp/crsp_*.parquet")
-        .sort("permno", "date")
-        .select(
-            "date",
-            "permno",
-            pl.col("return")
-            .log1p()
-            .rolling_sum(window_size=holding_period)
-            .shift(-holding_period)
-            .exp()
-            .sub(1)
-            .over('permno')
-            .alias("fwd_return"),
+    if rebalance_frequency == "monthly":
+        # Only month-end portfolios are held, so only their returns are read
+        year_months = (
+            data.with_columns(pl.col("date").dt.strftime("%Y%m").alias("year_month"))
+            .group_by("year_month")
+            .agg(pl.col("date").max())["date"]
+            .unique()
+            .sort()
+            .to_list()
         )
+        data = data.filter(pl.col("date").is_in(year_months))
+
+    forward_returns = scan_forward_returns(
+        "crsp",
+        holding_period,
+        start=data["date"].min(),
+        end=data["date"].max(),
+        ids=data["permno"].unique(),
     )
 
     data = (
@@ -55,18 +167,8 @@ def construct_returns(
         )
 
     elif rebalance_frequency == "monthly":
-        year_months = (
-            data.with_columns(pl.col("date").dt.strftime("%Y%m").alias("year_month"))
-            .group_by("year_month")
-            .agg(pl.col("date").max())["date"]
-            .unique()
-            .sort()
-            .to_list()
-        )
-
         result = (
-            data.filter(pl.col("date").is_in(year_months))
-            .group_by("date", "bin")
+            data.group_by("date", "bin")
             .agg(pl.col("fwd_return").mul("weight").sum().alias("return"))
             .pivot(index="date", on="bin", values="return")
             .with_columns(pl.col(top_bin).sub(bottom_bin).alias("spread"))
@@ -88,31 +190,24 @@ def construct_returns_from_weights(
         case "daily":
             holding_period = 1
         case "monthly":
-            holding_period = 21
+            # Month-end portfolios are held over the following calendar month
+            holding_period = "month"
         case _:
             raise ValueError(
                 f"Rebalance frequency not implemented: {rebalance_frequency}"
             )
 
-    forward_returns = (
-        pl.scan_parquet("data/barra/barra_*.parquet")
-        .sort("barrid", "date")
-        .select(
-            "date",
-            "barrid",
-            pl.col("return")
-            .log1p()
-            .rolling_sum(window_size=holding_period)
-            .shift(-holding_period)
-            .exp()
-            .sub(1)
-            .over('barrid')
-            .alias("fwd_return"),
-        )
+    forward_returns = scan_forward_returns(
+        "barra",
+        holding_period,
+        start=weights["date"].min(),
+        end=weights["date"].max(),
+        ids=weights["barrid"].unique(),
     )
 
     returns = (
         weights.lazy()
+        .with_columns(pl.col("barrid").cast(pl.Categorical))
         .join(other=forward_returns, on=["date", "barrid"], how="left")
         .group_by("date")
         .agg(pl.col("weight").mul(pl.col("fwd_return")).sum().alias("return"))
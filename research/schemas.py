@@ -0,0 +1,132 @@
+import re
+
+import polars as pl
+
+from research.factor_models import beta_columns, get_factor_model, residual_column
+
+# Asset identifiers are stored compactly: permnos fit in 32 bits and barrids
+# and tickers repeat across millions of rows
+ID_DTYPES = {
+    "permno": pl.Int32,
+    "barrid": pl.Categorical,
+    "ticker": pl.Categorical,
+}
+
+# Inputs that only feed filters, weights and risk scaling, where float32 is
+# precise enough. Returns and factor data stay float64.
+FLOAT32_COLUMNS = ["price", "shares", "market_cap", "specific_risk", "predicted_beta"]
+
+CRSP = {
+    "date": pl.Date,
+    "permno": pl.Int32,
+    "ticker": pl.Categorical,
+    "price": pl.Float64,
+    "return": pl.Float64,
+    "shares": pl.Float64,
+    "market_cap": pl.Float64,
+}
+
+BARRA = {
+    "date": pl.Date,
+    "barrid": pl.Categorical,
+    "ticker": pl.Categorical,
+    "price": pl.Float64,
+    "return": pl.Float64,
+    "predicted_beta": pl.Float64,
+    "specific_risk": pl.Float64,
+    "market_cap": pl.Float64,
+}
+
+FF3 = {
+    "date": pl.Date,
+    "mkt_rf": pl.Float64,
+    "smb": pl.Float64,
+    "hml": pl.Float64,
+    "rf": pl.Float64,
+}
+
+FF5 = FF3 | {"rmw": pl.Float64, "cma": pl.Float64}
+
+MOMENTUM_FACTOR_RETURNS = {"date": pl.Date} | {
+    col: pl.Float64 for col in ["sl", "sn", "sw", "bl", "bn", "bw", "mom"]
+}
+
+DMOM_COEFFICIENTS = {"date": pl.Date, "gamma_0": pl.Float64, "gamma_1": pl.Float64}
+
+DMOM_MARKET_DATA = {
+    "date": pl.Date,
+    "r_mom": pl.Float64,
+    "bear_indicator": pl.Int32,
+    "rmrf_variance": pl.Float64,
+}
+
+ALPHAS = {"date": pl.Date, "barrid": pl.Categorical, "alpha": pl.Float64}
+
+
+def betas_schema(id_col: str, model: str) -> dict[str, pl.DataType]:
+    columns = ["alpha"] + beta_columns(get_factor_model(model))
+    return {"date": pl.Date, id_col: ID_DTYPES[id_col]} | {
+        col: pl.Float64 for col in columns
+    }
+
+
+def residuals_schema(id_col: str, model: str) -> dict[str, pl.DataType]:
+    return {
+        "date": pl.Date,
+        id_col: ID_DTYPES[id_col],
+        residual_column(get_factor_model(model)): pl.Float64,
+    }
+
+
+def get_schema(name: str) -> dict[str, pl.DataType]:
+    """Declared column types of a dataset under data/."""
+    betas = re.fullmatch(r"(crsp|barra)_(\w+?)_betas(_\d+)?", name)
+    if betas is not None:
+        id_col = "permno" if betas.group(1) == "crsp" else "barrid"
+        return betas_schema(id_col, betas.group(2))
+
+    residuals = re.fullmatch(r"(crsp|barra)_(\w+?)_residuals", name)
+    if residuals is not None:
+        id_col = "permno" if residuals.group(1) == "crsp" else "barrid"
+        return residuals_schema(id_col, residuals.group(2))
+
+    if name.startswith("panels/") and name.endswith("_monthly"):
+        return get_schema(name.removesuffix("_monthly")) | {"monthly_return": pl.Float64}
+
+    match name:
+        case "crsp":
+            return CRSP
+        case "barra":
+            return BARRA
+        case "fama_french_factors/ff3":
+            return FF3
+        case "fama_french_factors/ff5":
+            return FF5
+        case "momentum_factor_returns/momentum_factor_returns":
+            return MOMENTUM_FACTOR_RETURNS
+        case "dmom_coefficients/dmom_coefficients":
+            return DMOM_COEFFICIENTS
+        case "dmom_coefficients/market_data":
+            return DMOM_MARKET_DATA
+        case "panels/crsp_ff5_betas":
+            return CRSP | FF5 | residuals_schema("permno", "ff3")
+        case "panels/crsp_dmom":
+            return CRSP
+        case "forward_returns/crsp":
+            return {"date": pl.Date, "permno": pl.Int32}
+        case "forward_returns/barra":
+            return {"date": pl.Date, "barrid": pl.Categorical}
+        case _ if name.startswith("alphas/"):
+            return ALPHAS
+        case _:
+            raise ValueError(f"Schema not declared for dataset: {name}")
+
+
+def cast_to_schema(data: pl.DataFrame, name: str) -> pl.DataFrame:
+    """Cast the declared columns of a dataset, leaving any extra columns as is."""
+    schema = get_schema(name)
+    return data.cast({col: dtype for col, dtype in schema.items() if col in data.columns})
+
+
+def float32_columns(columns: list[str]) -> list[pl.Expr]:
+    return [pl.col(col).cast(pl.Float32) for col in FLOAT32_COLUMNS if col in columns]
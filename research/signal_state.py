@@ -0,0 +1,104 @@
+import datetime as dt
+import hashlib
+from pathlib import Path
+
+import polars as pl
+
+from research.models import Signal
+from research.signals import signal_fingerprint, with_signals
+from research.storage import DATA_DIR, write_parquet
+
+STATE_DIR = DATA_DIR / ".state" / "signals"
+
+
+def state_path(name: str) -> Path:
+    return STATE_DIR / f"{name}.parquet"
+
+
+def state_exists(name: str) -> bool:
+    return state_path(name).exists()
+
+
+def state_version(signals: list[Signal]) -> str:
+    """Hash of the signal definitions a state was built for."""
+    digest = hashlib.blake2b(digest_size=16)
+    for signal in sorted(signals, key=lambda signal: signal.name):
+        digest.update(signal_fingerprint(signal, []).encode())
+    return digest.hexdigest()
+
+
+def input_columns(signals: list[Signal], id_col: str) -> list[str]:
+    """Columns the signals read, less the window terms they compute themselves."""
+    terms = {name for signal in signals for name in signal.terms}
+    names = {"date", id_col}
+    for signal in signals:
+        for expr in [signal.expr, *signal.terms.values()]:
+            names.update(expr.meta.root_names())
+    return sorted(names - terms)
+
+
+def buffer_size(signals: list[Signal]) -> int:
+    return max(signal.lookback_days for signal in signals)
+
+
+def last_state_date(name: str) -> dt.date:
+    return dt.date.fromisoformat(pl.read_parquet_metadata(state_path(name))["last_date"])
+
+
+def save_state(name: str, buffer: pl.DataFrame, signals: list[Signal], id_col: str) -> None:
+    """Keep the last lookback rows of every asset, the only rows its next values read."""
+    rows_from_end = pl.int_range(pl.len(), 0, -1).over(id_col)
+    buffer = buffer.filter(rows_from_end.le(buffer_size(signals)))
+    write_parquet(
+        buffer,
+        state_path(name),
+        metadata={
+            "signals": state_version(signals),
+            "last_date": buffer["date"].max().isoformat(),
+        },
+    )
+
+
+def init_signal_state(data: pl.DataFrame, signals: list[Signal], id_col: str) -> pl.DataFrame:
+    """Build the rolling state of signals from history, sorted by id_col and date.
+
+    Returns the buffer to persist with save_state.
+    """
+    return data.select(input_columns(signals, id_col))
+
+
+def advance_signal_state(
+    name: str, data: pl.DataFrame, signals: list[Signal], id_col: str
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Compute signals on the rows of data after the state's last date.
+
+    The state holds each asset's last lookback_days input rows. The signals'
+    rolling windows are re-evaluated over those rows and the new ones, not
+    updated from running sums, so a run costs O(assets x lookback_days) plus
+    a sort of that buffer however few days are new. That is still far less
+    than the full history, and gives the batch values.
+    Returns the new rows with a column per signal and the advanced buffer.
+    The stored state is left as is, save the buffer with save_state once the
+    values computed from it are written, so a failed run can be repeated.
+    """
+    if pl.read_parquet_metadata(state_path(name))["signals"] != state_version(signals):
+        raise ValueError(
+            f"Signal state {name} was built for other signal definitions, rebuild it "
+            "from history with init_signal_state."
+        )
+
+    last_date = last_state_date(name)
+    columns = input_columns(signals, id_col)
+    new_rows = data.filter(pl.col("date").gt(last_date)).select(columns)
+    buffer = pl.concat([pl.read_parquet(state_path(name)).select(columns), new_rows]).sort(
+        id_col, "date"
+    )
+
+    result = with_signals(buffer, signals).filter(pl.col("date").gt(last_date))
+    rows = data.filter(pl.col("date").gt(last_date)).join(
+        result.select(id_col, "date", *[signal.name for signal in signals]),
+        on=[id_col, "date"],
+        how="left",
+        maintain_order="left",
+    )
+    return rows, buffer
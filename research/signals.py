@@ -1,111 +1,119 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections.abc import Iterator
+from itertools import chain
+
 import polars as pl
 
-from research.models import Signal
+from research.models import AlphaConstructor, Constraint, Filter, Signal
+from research.storage import DATA_DIR, ID_COLUMNS, dataset_version, evict, write_parquet
 
+SIGNAL_CACHE_DIR = DATA_DIR / ".cache" / "signals"
+SIGNAL_INDEX_FILE = SIGNAL_CACHE_DIR / "index.json"
 
-def momentum(id_col: str) -> Signal:
-    return Signal(
-        name="momentum",
-        expr=pl.col("return")
+# Set RESEARCH_SIGNAL_CACHE=0 to always recompute signals
+SIGNAL_CACHE_ENV = "RESEARCH_SIGNAL_CACHE"
+
+# Disk quota of the cache in GB, least recently used values are evicted first
+SIGNAL_QUOTA_ENV = "RESEARCH_SIGNAL_CACHE_GB"
+DEFAULT_SIGNAL_QUOTA_GB = 20.0
+
+# Window terms shared by several signals and filters. They are referenced by
+# column name, so construct_filtered_signals computes each one once per pass.
+MOMENTUM = "_momentum"
+VOLATILITY_FORECAST = "_volatility_forecast"
+IDIOSYNCRATIC_MOMENTUM = "_idiosyncratic_momentum"
+IDIOSYNCRATIC_VOLATILITY = "_idiosyncratic_volatility"
+
+
+def momentum_terms(id_col: str) -> dict[str, pl.Expr]:
+    return {
+        MOMENTUM: pl.col("return")
         .log1p()
-        .rolling_sum(window_size=230)
+        .rolling_sum(window_size=230) # 11 month momentum
         .shift(22)
         .over(id_col)
-        .alias("momentum"),
+    }
+
+
+def volatility_forecast_terms(id_col: str) -> dict[str, pl.Expr]:
+    return {
+        VOLATILITY_FORECAST: pl.col("return")
+        .pow(2)
+        .truediv(126)
+        .rolling_sum(window_size=126) # 6 month volatility
+        .mul(21)
+        .over(id_col)
+    }
+
+
+def idiosyncratic_momentum_terms(id_col: str) -> dict[str, pl.Expr]:
+    residual = pl.col("residual_ff3")
+
+    return {
+        IDIOSYNCRATIC_MOMENTUM: residual.rolling_sum(230).shift(22).over(id_col),
+        IDIOSYNCRATIC_VOLATILITY: residual.rolling_std(230).shift(22).over(id_col),
+    }
+
+
+# Formation and skip periods of the momentum grid, in months of 21 trading days
+MOMENTUM_GRID_FORMATIONS = [3, 6, 9, 12]
+MOMENTUM_GRID_SKIPS = [0, 1]
+TRADING_DAYS_PER_MONTH = 21
+
+CUMULATIVE_LOG_RETURN = "_cumulative_log_return"
+CUMULATIVE_COUNT = "_cumulative_count"
+
+
+def cumulative_return_terms(id_col: str) -> dict[str, pl.Expr]:
+    log_return = pl.col("return").log1p()
+
+    return {
+        CUMULATIVE_LOG_RETURN: log_return.fill_null(0).cum_sum().over(id_col),
+        CUMULATIVE_COUNT: log_return.is_not_null().cum_sum().over(id_col),
+    }
+
+
+def momentum(id_col: str) -> Signal:
+    return Signal(
+        name="momentum",
+        expr=pl.col(MOMENTUM).alias("momentum"),
         columns=[id_col, "return"],
         lookback_days=252,
+        terms=momentum_terms(id_col),
     )
 
 
 def idio_mom_vol_scaled_ff3(id_col: str) -> Signal:
-    residual = (
-        pl.col("return")
-        .sub("rf")
-        .sub(pl.col("alpha"))
-        .sub(pl.col("beta_mkt").mul("mkt_rf"))
-        .sub(pl.col("beta_smb").mul("smb"))
-        .sub(pl.col("beta_hml").mul("hml"))
-        .alias("residual")
-    )
-
     return Signal(
         name="volatility_scaled_idiosyncratic_momentum_fama_french_3",
         expr=(
-            residual.rolling_sum(230)
-            .truediv(residual.rolling_std(230))
-            .shift(22)
-            .over(id_col)
+            pl.col(IDIOSYNCRATIC_MOMENTUM)
+            .truediv(pl.col(IDIOSYNCRATIC_VOLATILITY))
             .alias("volatility_scaled_idiosyncratic_momentum_fama_french_3")
         ),
-        columns=[
-            id_col,
-            "return",
-            "rf",
-            "alpha",
-            "mkt_rf",
-            "smb",
-            "hml",
-            "beta_mkt",
-            "beta_smb",
-            "beta_hml",
-        ],
+        columns=[id_col, "residual_ff3"],
         lookback_days=252,
+        terms=idiosyncratic_momentum_terms(id_col),
     )
 
 
 def idio_mom_ff3(id_col: str) -> Signal:
-    residual = (
-        pl.col("return")
-        .sub("rf")
-        .sub(pl.col("alpha"))
-        .sub(pl.col("beta_mkt").mul("mkt_rf"))
-        .sub(pl.col("beta_smb").mul("smb"))
-        .sub(pl.col("beta_hml").mul("hml"))
-        .alias("residual")
-    )
-
     return Signal(
         name="idiosyncratic_momentum_fama_french_3",
-        expr=(
-            residual.rolling_sum(230)
-            .shift(22)
-            .over(id_col)
-            .alias("idiosyncratic_momentum_fama_french_3")
-        ),
-        columns=[
-            id_col,
-            "return",
-            "rf",
-            "alpha",
-            "mkt_rf",
-            "smb",
-            "hml",
-            "beta_mkt",
-            "beta_smb",
-            "beta_hml",
-        ],
+        expr=pl.col(IDIOSYNCRATIC_MOMENTUM).alias("idiosyncratic_momentum_fama_french_3"),
+        columns=[id_col, "residual_ff3"],
         lookback_days=252,
+        terms=idiosyncratic_momentum_terms(id_col),
     )
 
 def cmom(id_col: str) -> Signal:
-    momentum = (
-        pl.col("return")
-        .log1p()
-        .rolling_sum(window_size=230) # 11 month momentum
-        .shift(22)
-        .over(id_col)
-    )
-
-    volatility_forecast = (
-        pl.col("return")
-        .pow(2)
-        .truediv(126)
-        .rolling_sum(window_size=126) # 6 month volatility
-        .mul(21)
-        .over(id_col)
-    )
-
-    vol_scaled_momentum = momentum / volatility_forecast
+    vol_scaled_momentum = pl.col(MOMENTUM) / pl.col(VOLATILITY_FORECAST)
 
     clean_vol_scaled_momentum = (
         pl.when(vol_scaled_momentum.is_infinite())
@@ -117,18 +125,11 @@ def cmom(id_col: str) -> Signal:
         name="constant_volatility_scaled_momentum",
         expr=clean_vol_scaled_momentum.alias('constant_volatility_scaled_momentum'),
         columns=['return', id_col],
-        lookback_days=252
+        lookback_days=252,
+        terms=momentum_terms(id_col) | volatility_forecast_terms(id_col),
     )
 
 def smom(id_col: str) -> Signal:
-    momentum = (
-        pl.col("return")
-        .log1p()
-        .rolling_sum(window_size=230) # 11 month momentum
-        .shift(22)
-        .over(id_col)
-    )
-
     return_squared_neg = (
         pl.when(pl.col("return") < 0)
         .then(pl.col("return").pow(2))
@@ -143,7 +144,7 @@ def smom(id_col: str) -> Signal:
         .over(id_col)
     )
 
-    vol_scaled_momentum = momentum / volatility_forecast
+    vol_scaled_momentum = pl.col(MOMENTUM) / volatility_forecast
 
     clean_vol_scaled_momentum = (
         pl.when(vol_scaled_momentum.is_infinite())
@@ -155,38 +156,67 @@ def smom(id_col: str) -> Signal:
         name="semi_volatility_scaled_momentum",
         expr=clean_vol_scaled_momentum.alias('semi_volatility_scaled_momentum'),
         columns=['return', id_col],
-        lookback_days=252
+        lookback_days=252,
+        terms=momentum_terms(id_col),
     )
 
 def dmom(id_col: str) -> Signal:
-    momentum = (
-        pl.col("return")
-        .log1p()
-        .rolling_sum(window_size=230) # 11 month momentum
-        .shift(22)
-        .over(id_col)
-    )
-    volatility_forecast = (
-        pl.col("return")
-        .pow(2)
-        .truediv(126)
-        .rolling_sum(window_size=126) # 6 month volatility
-        .mul(21)
-        .over(id_col)
-    )
-
     return_forecast = (
         pl.col('gamma_0').add(pl.col('gamma_1').mul(pl.col('bear_indicator').mul('rmrf_variance')))
     )
         
     return Signal(
         name="dynamic_volatility_scaled_momentum",
-        expr=momentum.mul(return_forecast).truediv(volatility_forecast).alias('dynamic_volatility_scaled_momentum'),
-        columns=['return', id_col],
-        lookback_days=252
+        expr=pl.col(MOMENTUM).mul(return_forecast).truediv(pl.col(VOLATILITY_FORECAST)).alias('dynamic_volatility_scaled_momentum'),
+        columns=['return', id_col, 'gamma_0', 'gamma_1', 'bear_indicator', 'rmrf_variance'],
+        lookback_days=252,
+        terms=momentum_terms(id_col) | volatility_forecast_terms(id_col),
     )
 
 
+def grid_momentum_name(formation: int, skip: int) -> str:
+    return f"momentum_{formation}m_skip_{skip}m"
+
+
+def grid_momentum(id_col: str, formation: int, skip: int) -> Signal:
+    """Log return over formation months, ending skip months before each date.
+
+    Computed by differencing the asset's cumulative log return, a shared term,
+    so with_signals computes the cumulative sums of a grid once and takes all
+    of its shifted differences in the next with_columns. Like rolling_sum, it
+    is null unless every return in the window is present.
+    """
+    name = grid_momentum_name(formation, skip)
+    window = formation * TRADING_DAYS_PER_MONTH
+    lag = skip * TRADING_DAYS_PER_MONTH
+
+    def window_sum(column: str) -> pl.Expr:
+        # The window (t - lag - window, t - lag], with nothing before the first row
+        return pl.col(column).shift(lag).sub(pl.col(column).shift(lag + window, fill_value=0))
+
+    return Signal(
+        name=name,
+        expr=pl.when(window_sum(CUMULATIVE_COUNT).eq(window))
+        .then(window_sum(CUMULATIVE_LOG_RETURN))
+        .over(id_col)
+        .alias(name),
+        columns=[id_col, "return"],
+        lookback_days=window + lag,
+        terms=cumulative_return_terms(id_col),
+    )
+
+
+def momentum_grid(
+    id_col: str,
+    formations: list[int] = MOMENTUM_GRID_FORMATIONS,
+    skips: list[int] = MOMENTUM_GRID_SKIPS,
+) -> list[Signal]:
+    """Every (formation, skip) momentum, from one cumulative sum in with_signals."""
+    return [
+        grid_momentum(id_col, formation, skip) for formation in formations for skip in skips
+    ]
+
+
 def get_signal(name: str, id_col: str) -> Signal:
     match name:
         case "momentum":
@@ -201,10 +231,252 @@ def get_signal(name: str, id_col: str) -> Signal:
             return smom(id_col)
         case "dynamic_volatility_scaled_momentum":
             return dmom(id_col)
+        case _ if match := re.fullmatch(r"momentum_(\d+)m_skip_(\d+)m", name):
+            return grid_momentum(id_col, int(match[1]), int(match[2]))
         case _:
             raise ValueError(f"{name} not implemented")
 
 
-def construct_signals(data: pl.DataFrame, signal: Signal) -> pl.DataFrame:
-    """Data is assumed to have already been sorted by id_col and date."""
-    return data.with_columns(signal.expr)
+def with_signals(
+    data: pl.DataFrame | pl.LazyFrame, signals: list[Signal]
+) -> pl.DataFrame | pl.LazyFrame:
+    """Add the columns of signals, computing each of their window terms once."""
+    terms = {}
+    for signal in signals:
+        terms |= signal.terms
+    return (
+        data.with_columns(**terms)
+        .with_columns(signal.expr for signal in signals)
+        .drop(list(terms))
+    )
+
+
+def declared_columns(
+    items: list[Signal | Filter | AlphaConstructor | Constraint],
+    extra: list[str] | None = None,
+) -> list[str]:
+    """The date, id and declared columns of items, plus extra."""
+    wanted = {"date", *ID_COLUMNS, *(extra or [])}
+    for item in items:
+        wanted.update(item.columns)
+        if isinstance(item, Signal):
+            # Monthly panels store the signal itself
+            wanted.add(item.name)
+    return sorted(wanted)
+
+
+def select_declared_columns(
+    data: pl.DataFrame | pl.LazyFrame,
+    items: list[Signal | Filter | AlphaConstructor | Constraint],
+    extra: list[str] | None = None,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Keep the declared_columns of items, plus extra, that data has.
+
+    Applied to a scan before collecting, the projection reaches the parquet
+    reader, so undeclared columns are never read. Declared columns that data
+    does not have yet, like the signal a filter reads, are skipped.
+    """
+    wanted = declared_columns(items, extra)
+    return data.select(name for name in data.collect_schema().names() if name in wanted)
+
+
+def construct_signals(
+    data: pl.DataFrame | pl.LazyFrame, signal: Signal
+) -> pl.DataFrame | pl.LazyFrame:
+    """Data is assumed to have already been sorted by id_col and date.
+
+    Monthly panels already carry the signal computed on daily data, so it is
+    kept as is.
+    """
+    if signal.name in data.collect_schema().names():
+        return data
+    return with_signals(data, [signal])
+
+
+def construct_filtered_signals(
+    data: pl.DataFrame, signals: list[Signal], filters: dict[str, list[Filter]]
+) -> Iterator[tuple[Signal, pl.DataFrame]]:
+    """Construct several signals and their filters in one pass over data.
+
+    Window terms shared by the signals and filters are computed once, and
+    each distinct filter once as a boolean mask however many signals use it.
+    Yields every signal with the rows that pass filters[signal.name], the
+    same rows construct_signals and apply_filters would give.
+    """
+    new_signals = [signal for signal in signals if signal.name not in data.columns]
+
+    distinct_filters: list[Filter] = []
+    for filter_ in chain.from_iterable(filters.values()):
+        if not any(filter_.expr.meta.eq(other.expr) for other in distinct_filters):
+            distinct_filters.append(filter_)
+    masks = [f"_filter_{index}" for index in range(len(distinct_filters))]
+
+    terms = {}
+    for item in [*new_signals, *distinct_filters]:
+        terms |= item.terms
+
+    evaluated = (
+        data.lazy()
+        .with_columns(**terms)
+        .with_columns(signal.expr for signal in new_signals)
+        .with_columns(
+            filter_.expr.alias(mask) for filter_, mask in zip(distinct_filters, masks)
+        )
+        .drop(list(terms))
+        .collect()
+    )
+
+    for signal in signals:
+        own_masks = [
+            mask
+            for filter_ in filters.get(signal.name, [])
+            for other, mask in zip(distinct_filters, masks)
+            if filter_.expr.meta.eq(other.expr)
+        ]
+        filtered = evaluated.filter(*own_masks) if own_masks else evaluated
+        yield signal, filtered.drop(masks)
+
+
+def signal_fingerprint(signal: Signal, datasets: list[str]) -> str:
+    """Hash of a signal's definition and of the datasets it is computed on."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pl.__version__.encode())
+    digest.update(signal.expr.meta.serialize())
+    for name, term in sorted(signal.terms.items()):
+        digest.update(name.encode())
+        digest.update(term.meta.serialize())
+    digest.update(json.dumps([sorted(signal.columns), signal.lookback_days]).encode())
+    digest.update(dataset_version(datasets).encode())
+    return digest.hexdigest()
+
+
+def load_signal_index() -> list[dict]:
+    if not SIGNAL_INDEX_FILE.exists():
+        return []
+    entries = json.loads(SIGNAL_INDEX_FILE.read_text())
+    return [entry for entry in entries if (SIGNAL_CACHE_DIR / entry["file"]).exists()]
+
+
+def save_signal_index(entries: list[dict]) -> None:
+    SIGNAL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = SIGNAL_INDEX_FILE.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(entries, indent=2))
+    tmp_path.replace(SIGNAL_INDEX_FILE)
+
+
+def cached_signals(
+    data: pl.DataFrame,
+    signals: list[Signal],
+    datasets: list[str],
+    start: dt.date,
+    end: dt.date,
+) -> pl.DataFrame:
+    """Add the columns of signals to data, reusing values stored by earlier runs.
+
+    data is the scan of datasets over [start, end] plus the signals' warm-up.
+    A signal is cached under data/.cache/signals as (date, id, value) rows of
+    [start, end], keyed by its expressions, columns and lookback and by the
+    versions of datasets, so editing the signal or rebuilding an input
+    recomputes it. Any later range inside [start, end] is served by date and
+    id pushdown. Signals are null on the warm-up rows either way, so trim
+    them after filtering. The least recently used values are evicted once
+    the cache exceeds RESEARCH_SIGNAL_CACHE_GB.
+    """
+    new_signals = [signal for signal in signals if signal.name not in data.columns]
+    in_range = pl.col("date").is_between(start, end)
+    if os.environ.get(SIGNAL_CACHE_ENV, "1") == "0" or not new_signals:
+        return with_signals(data, new_signals).with_columns(
+            pl.when(in_range).then(pl.col(signal.name)) for signal in new_signals
+        )
+
+    id_col = next(col for col in ID_COLUMNS if col in data.columns)
+    n_rows = data.select(in_range.sum()).item()
+    ids = data.get_column(id_col).unique()
+
+    entries = load_signal_index()
+    cached, missing = [], []
+    for signal in new_signals:
+        fingerprint = signal_fingerprint(signal, datasets)
+        for entry in entries:
+            if (
+                entry["fingerprint"] != fingerprint
+                or entry["start"] > start.isoformat()
+                or entry["end"] < end.isoformat()
+            ):
+                continue
+            values = (
+                pl.scan_parquet(SIGNAL_CACHE_DIR / entry["file"])
+                .filter(in_range, pl.col(id_col).is_in(ids.implode()))
+                .collect()
+            )
+            # Values of a different set of assets are not reused
+            if values.height == n_rows:
+                entry["last_used"] = time.time()
+                cached.append(values)
+                break
+        else:
+            missing.append((signal, fingerprint))
+
+    result = with_signals(data, [signal for signal, _ in missing]).with_columns(
+        pl.when(in_range).then(pl.col(signal.name)) for signal, _ in missing
+    )
+    if cached:
+        result = result.lazy()
+        for values in cached:
+            result = result.join(
+                values.lazy(), on=["date", id_col], how="left", maintain_order="left"
+            )
+        result = result.collect()
+
+    for signal, fingerprint in missing:
+        file_name = f"{fingerprint}_{start}_{end}.parquet"
+        write_parquet(
+            result.filter(in_range).select("date", id_col, signal.name),
+            SIGNAL_CACHE_DIR / file_name,
+        )
+        entry = {
+            "fingerprint": fingerprint,
+            "signal": signal.name,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "file": file_name,
+            "size": (SIGNAL_CACHE_DIR / file_name).stat().st_size,
+            "last_used": time.time(),
+        }
+        # The new values replace those of narrower ranges
+        for other in entries:
+            if (
+                other["fingerprint"] == fingerprint
+                and other["file"] != file_name
+                and other["start"] >= entry["start"]
+                and other["end"] <= entry["end"]
+            ):
+                (SIGNAL_CACHE_DIR / other["file"]).unlink(missing_ok=True)
+        entries = [
+            other
+            for other in entries
+            if (SIGNAL_CACHE_DIR / other["file"]).exists() and other["file"] != file_name
+        ] + [entry]
+
+    quota_bytes = float(os.environ.get(SIGNAL_QUOTA_ENV, DEFAULT_SIGNAL_QUOTA_GB)) * 1024**3
+    save_signal_index(evict(entries, quota_bytes, SIGNAL_CACHE_DIR))
+    return result
+
+
+def invalidate_signal_cache(signal_names: list[str] | None = None) -> None:
+    """Delete the cached values of the named signals, or of every signal."""
+    kept = []
+    for entry in load_signal_index():
+        if signal_names is None or entry["signal"] in signal_names:
+            (SIGNAL_CACHE_DIR / entry["file"]).unlink(missing_ok=True)
+        else:
+            kept.append(entry)
+    save_signal_index(kept)
+
+
+if __name__ == '__main__':
+    match sys.argv[1:]:
+        case ["invalidate", *signal_names]:
+            invalidate_signal_cache(signal_names or None)
+        case _:
+            raise SystemExit("usage: python research/signals.py invalidate [signal_name ...]")
@@ -0,0 +1,458 @@
+import datetime as dt
+import hashlib
+import json
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import polars as pl
+
+from research.schemas import cast_to_schema, float32_columns
+
+DATA_DIR = Path("data")
+ID_COLUMNS = ["permno", "barrid"]
+SORTED_BY_KEY = "sorted_by"
+
+# Rows are sorted by (id, date) inside each year partition, so date ranges are
+# pruned by the partition directories and row group statistics prune ids.
+ROW_GROUP_SIZE = 128 * 1024
+
+# Opt-in cache of decoded datasets as uncompressed Arrow IPC files
+IPC_CACHE_ENV = "RESEARCH_IPC_CACHE"
+IPC_CACHE_DIR = DATA_DIR / ".cache" / "ipc"
+
+# Full rebuilds are written here and moved into data/{name} once complete
+STAGING_DIR = DATA_DIR / ".staging"
+
+# Opt-in float32 loading of the inputs listed in schemas.FLOAT32_COLUMNS
+FLOAT32_ENV = "RESEARCH_FLOAT32"
+
+
+def dataset_dir(name: str) -> Path:
+    return DATA_DIR / name
+
+
+def staging_dir(name: str) -> Path:
+    return STAGING_DIR / name
+
+
+def sort_keys(columns: list[str]) -> list[str]:
+    """Sort order of a dataset: its id column (if any) then date."""
+    return [col for col in ID_COLUMNS if col in columns] + ["date"]
+
+
+def is_partitioned(name: str) -> bool:
+    return any(dataset_dir(name).glob("year=*"))
+
+
+def legacy_files(name: str) -> list[Path]:
+    """Files written before the partitioned layout, e.g. data/crsp/crsp_2020.parquet."""
+    directory = dataset_dir(name)
+    flat_file = directory.with_suffix(".parquet")
+    files = [flat_file] if flat_file.is_file() else []
+    if directory.is_dir():
+        files += [
+            path
+            for path in directory.glob("*.parquet")
+            if not path.name.startswith("part-")
+        ]
+    return sorted(files)
+
+
+def write_parquet(
+    data: pl.DataFrame, file_path: Path, metadata: dict[str, str] | None = None
+) -> None:
+    """Write one sorted file with its sort order recorded in the footer metadata."""
+    keys = sort_keys(data.columns)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = file_path.with_suffix(".tmp")
+    data.sort(keys).write_parquet(
+        tmp_path,
+        row_group_size=ROW_GROUP_SIZE,
+        statistics=True,
+        metadata={SORTED_BY_KEY: json.dumps(keys)} | (metadata or {}),
+    )
+    tmp_path.replace(file_path)
+
+
+def write_dataset(
+    data: pl.DataFrame,
+    name: str,
+    partition_by_year: bool = True,
+    part: int = 0,
+    append: bool = False,
+    metadata: dict[str, str] | None = None,
+    staged: bool = False,
+) -> None:
+    """Write data to data/{name} as sorted, hive-style year partitions.
+
+    Each partition is data/{name}/year={year}/part-{part}.parquet. Writers that
+    own disjoint ids (e.g. asset shards) use different parts. With append=True,
+    rows are merged into the existing part file of each year they touch.
+    Otherwise that part file is replaced. Small date-only datasets can skip
+    partitioning and are written to data/{name}/part-{part}.parquet. Extra
+    metadata (e.g. a version) is stored in each file's footer. Columns are
+    cast to the dataset's declared compact schema. With staged=True, data goes
+    to the build in progress of a staged_dataset block instead.
+    """
+    data = cast_to_schema(data, name)
+    directory = staging_dir(name) if staged else dataset_dir(name)
+
+    if not partition_by_year:
+        write_parquet(data, directory / f"part-{part}.parquet", metadata)
+        return
+
+    partitions = data.with_columns(pl.col("date").dt.year().alias("year")).partition_by(
+        "year", as_dict=True, include_key=False
+    )
+
+    for (year,), df_year in sorted(partitions.items()):
+        file_path = directory / f"year={year}" / f"part-{part}.parquet"
+
+        if append and file_path.exists():
+            df_year = pl.concat([pl.read_parquet(file_path), df_year])
+
+        write_parquet(df_year, file_path, metadata)
+
+
+def clear_dataset(name: str) -> None:
+    shutil.rmtree(dataset_dir(name), ignore_errors=True)
+
+
+@contextmanager
+def staged_dataset(name: str):
+    """Rebuild data/{name} from scratch and replace it only once the build succeeds.
+
+    Writes inside the block pass staged=True to write_dataset. A build that
+    fails or is interrupted leaves the previous dataset in place rather than
+    a partial one its version check would take as up to date.
+    """
+    staging = staging_dir(name)
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        yield
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    replaced = staging.with_name(staging.name + ".replaced")
+    shutil.rmtree(replaced, ignore_errors=True)
+    if dataset_dir(name).exists():
+        dataset_dir(name).rename(replaced)
+    if staging.exists():
+        dataset_dir(name).parent.mkdir(parents=True, exist_ok=True)
+        staging.rename(dataset_dir(name))
+    shutil.rmtree(replaced, ignore_errors=True)
+
+
+def evict(entries: list[dict], quota_bytes: float, cache_dir: Path) -> list[dict]:
+    """Drop the least recently used files of a cache index until it fits in the quota."""
+    entries = sorted(entries, key=lambda entry: entry["last_used"], reverse=True)
+    kept, total = [], 0
+    for entry in entries:
+        if kept and total + entry["size"] > quota_bytes:
+            (cache_dir / entry["file"]).unlink(missing_ok=True)
+            continue
+        kept.append(entry)
+        total += entry["size"]
+    return kept
+
+
+def dataset_exists(name: str) -> bool:
+    return any(dataset_dir(name).glob("**/part-*.parquet"))
+
+
+def read_metadata(name: str) -> dict[str, str]:
+    """Footer metadata of the dataset's first part file, empty if there is none."""
+    file_path = next(dataset_dir(name).glob("**/part-*.parquet"), None)
+    if file_path is None:
+        return {}
+    return pl.read_parquet_metadata(file_path)
+
+
+def read_sort_keys(name: str) -> list[str]:
+    """Sort order recorded when the dataset was written, empty if unknown."""
+    return json.loads(read_metadata(name).get(SORTED_BY_KEY, "[]"))
+
+
+def files_version(paths: list[Path]) -> str:
+    """Fingerprint of files from their paths, sizes and modification times."""
+    digest = hashlib.blake2b()
+    for path in sorted(paths):
+        stat = path.stat()
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def dataset_version(names: list[str]) -> str:
+    """Fingerprint of the files currently backing a set of datasets.
+
+    Rewriting any input changes the version without reading the data.
+    """
+    return files_version(
+        [path for name in names for path in dataset_dir(name).rglob("*.parquet")]
+    )
+
+
+def partitions_in_range(
+    name: str, start: dt.date | None = None, end: dt.date | None = None
+) -> list[Path]:
+    """Year partition directories of data/{name} overlapping [start, end], in order.
+
+    Unpartitioned datasets have their directory as the only partition.
+    """
+    directory = dataset_dir(name)
+    if not is_partitioned(name):
+        return [directory]
+
+    return [
+        path
+        for path in sorted(directory.glob("year=*"))
+        if (start is None or int(path.name[5:]) >= start.year)
+        and (end is None or int(path.name[5:]) <= end.year)
+    ]
+
+
+def scan_sort_keys(
+    name: str, start: dt.date | None = None, end: dt.date | None = None
+) -> list[str]:
+    """Columns a scan of data/{name} over [start, end] comes back sorted by.
+
+    Every file is sorted by its recorded keys, so a scan reading one file keeps
+    that order. Year partitions are read in order, so a date-only dataset with
+    one file per partition also stays sorted by date. Otherwise the part files
+    interleave and nothing is guaranteed.
+    """
+    files = [
+        sorted(partition.glob("part-*.parquet"))
+        for partition in partitions_in_range(name, start, end)
+    ]
+    files = [partition for partition in files if partition]
+    keys = read_sort_keys(name)
+
+    if len(files) == 1 and len(files[0]) == 1:
+        return keys
+    if keys == ["date"] and all(len(partition) == 1 for partition in files):
+        return keys
+    return []
+
+
+def scan_ipc_cache(
+    name: str, start: dt.date | None = None, end: dt.date | None = None
+) -> pl.LazyFrame:
+    """Scan data/{name} through decoded, uncompressed Arrow IPC copies.
+
+    Each partition is decoded from parquet once into data/.cache/ipc, tagged
+    with the version of its parquet files. Later scans memory-map the IPC
+    files, so processes on one node share the same page cache instead of
+    each decoding a private copy. Stale copies are replaced when the
+    partition is rewritten. A range with no partition gives an empty frame.
+    """
+    directory = dataset_dir(name)
+    scans = []
+    for partition in partitions_in_range(name, start, end):
+        files = sorted(partition.glob("part-*.parquet"))
+        label = partition.name if partition != directory else "all"
+        cache_path = IPC_CACHE_DIR / name / f"{label}-{files_version(files)}.arrow"
+
+        if not cache_path.exists():
+            for stale_path in cache_path.parent.glob(f"{label}-*.arrow"):
+                stale_path.unlink(missing_ok=True)
+
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            pl.read_parquet(files).write_ipc(tmp_path, compression="uncompressed")
+            tmp_path.replace(cache_path)
+
+        scans.append(pl.scan_ipc(cache_path))
+
+    if not scans:
+        schema = pl.read_parquet_schema(next(directory.glob("**/part-*.parquet")))
+        return pl.LazyFrame(schema=schema)
+
+    return pl.concat(scans)
+
+
+def scan_dataset(
+    name: str, start: dt.date | None = None, end: dt.date | None = None
+) -> pl.LazyFrame:
+    """Lazily scan data/{name}, pruning year partitions outside [start, end].
+
+    Partitions are read in year order and each is sorted by (id, date), so the
+    rows of every id come back in date order. Rolling windows with .over(id_col)
+    can therefore run without re-sorting the panel. When the files read keep
+    their recorded order across the scan (see scan_sort_keys), the scan is
+    marked as sorted by it. Setting RESEARCH_IPC_CACHE=1 reads through the
+    memory-mapped Arrow IPC cache instead of decoding parquet, and
+    RESEARCH_FLOAT32=1 loads the FLOAT32_COLUMNS of the schema as float32.
+    """
+    if legacy_files(name):
+        raise ValueError(
+            f"data/{name} uses the old file layout, "
+            f"run `python research/data/compact.py {name}` first."
+        )
+
+    if not dataset_exists(name):
+        raise FileNotFoundError(f"Dataset not found: data/{name}")
+
+    partitioned = is_partitioned(name)
+    use_cache = os.environ.get(IPC_CACHE_ENV, "0") == "1"
+    if use_cache:
+        scan = scan_ipc_cache(name, start, end)
+    else:
+        scan = pl.scan_parquet(
+            str(dataset_dir(name) / "**" / "*.parquet"), hive_partitioning=partitioned
+        )
+
+    if start is not None:
+        if partitioned and not use_cache:
+            scan = scan.filter(pl.col("year").ge(start.year))
+        scan = scan.filter(pl.col("date").ge(start))
+
+    if end is not None:
+        if partitioned and not use_cache:
+            scan = scan.filter(pl.col("year").le(end.year))
+        scan = scan.filter(pl.col("date").le(end))
+
+    if partitioned and not use_cache:
+        scan = scan.drop("year")
+
+    keys = scan_sort_keys(name, start, end)
+    if keys:
+        scan = scan.set_sorted(keys)
+
+    if os.environ.get(FLOAT32_ENV, "0") == "1":
+        scan = scan.with_columns(float32_columns(scan.collect_schema().names()))
+
+    return scan
+
+
+def shift_trading_days(name: str, date: dt.date, n: int) -> dt.date:
+    """Date n trading days of data/{name} after date, or before it when n < 0.
+
+    Rolling windows count each asset's own rows, so for datasets with an id
+    column this is the furthest date any asset needs to have n rows before (or
+    after) date, or to reach its first (or last) row. Only the id and date
+    columns of a calendar span around date are scanned, and of the full
+    history of the assets with fewer rows in it. Falls back to the first or
+    last date found when the dataset ends sooner.
+    """
+    if n == 0:
+        return date
+
+    # 252 trading days span about 365 calendar days
+    margin = dt.timedelta(days=abs(n) * 7 // 4 + 14)
+    if n < 0:
+        scan = scan_dataset(name, date - margin, date - dt.timedelta(days=1))
+        history = scan_dataset(name, None, date - dt.timedelta(days=1))
+    else:
+        scan = scan_dataset(name, date + dt.timedelta(days=1), date + margin)
+        history = scan_dataset(name, date + dt.timedelta(days=1), None)
+
+    id_cols = [col for col in ID_COLUMNS if col in scan.collect_schema().names()]
+    dates = scan.select("date").unique().sort("date").collect()["date"]
+    if dates.is_empty():
+        return date
+
+    fallback = dates[max(len(dates) + n, 0)] if n < 0 else dates[min(n, len(dates)) - 1]
+    if not id_cols:
+        return fallback
+
+    def shifted(data: pl.LazyFrame) -> pl.DataFrame:
+        """Each asset's n-th row from date, or its furthest one, and its row count."""
+        return (
+            data.select(*id_cols, "date")
+            .group_by(id_cols)
+            .agg(
+                pl.col("date").sort().tail(-n).first()
+                if n < 0
+                else pl.col("date").sort().head(n).last(),
+                pl.len(),
+            )
+            .collect()
+        )
+
+    in_span = shifted(scan)
+    # Assets listed or delisted inside the span, or with a gap in their rows
+    short = in_span.filter(pl.col("len").lt(abs(n)))
+    if not short.is_empty():
+        in_span = pl.concat(
+            [
+                in_span.filter(pl.col("len").ge(abs(n))),
+                shifted(
+                    history.filter(
+                        pl.all_horizontal(
+                            pl.col(col).is_in(short[col].implode()) for col in id_cols
+                        )
+                    )
+                ),
+            ]
+        )
+
+    return in_span["date"].min() if n < 0 else in_span["date"].max()
+
+
+def compact_dataset(name: str) -> None:
+    """Rewrite data/{name} as one sorted file per partition.
+
+    Converts the old layout (data/crsp/crsp_{year}.parquet or
+    data/fama_french_factors/ff5.parquet) and merges the part files left by
+    sharded or incremental writers. Their footer metadata (e.g. the version
+    or shard bounds) is kept, so compacting does not trigger rebuilds.
+    """
+    directory = dataset_dir(name)
+    old_files = legacy_files(name)
+    part_files = sorted(directory.glob("**/part-*.parquet"))
+
+    if not old_files and not part_files:
+        raise FileNotFoundError(f"Dataset not found: data/{name}")
+
+    flat_file = directory.with_suffix(".parquet")
+    if old_files == [flat_file] and not part_files:
+        data = pl.read_parquet(flat_file)
+        write_dataset(data, name, partition_by_year=sort_keys(data.columns) != ["date"])
+        flat_file.unlink()
+        return
+
+    partitioned = bool(old_files) or is_partitioned(name)
+
+    groups: dict[str, list[Path]] = {}
+    for path in old_files + part_files:
+        if path.name.startswith("part-"):
+            year = re.search(r"year=(\d{4})", str(path))
+        else:
+            year = re.search(r"_(\d{4})(?:_\d+)?\.parquet$", path.name)
+            if year is None:
+                raise ValueError(f"Cannot infer the year of {path}")
+        groups.setdefault(year.group(1) if year else "", []).append(path)
+
+    for year, paths in sorted(groups.items()):
+        data = pl.concat([pl.read_parquet(path) for path in paths], how="diagonal")
+        if partitioned:
+            target = directory / f"year={year}" / "part-0.parquet"
+        else:
+            target = directory / "part-0.parquet"
+
+        # Keep the version and shard bounds the writers stored, which must agree
+        metadata = [
+            {
+                key: value
+                for key, value in pl.read_parquet_metadata(path).items()
+                if key not in [SORTED_BY_KEY, "ARROW:schema"]
+            }
+            for path in paths
+        ]
+        if any(other != metadata[0] for other in metadata[1:]):
+            raise ValueError(f"Parts of data/{name} {year} were written with different metadata")
+
+        compacted = target.with_suffix(".compacted")
+        write_parquet(cast_to_schema(data, name), compacted, metadata[0])
+        # The target is replaced first, so an interruption never loses the partition
+        compacted.replace(target)
+        for path in paths:
+            if path != target:
+                path.unlink()
@@ -0,0 +1,48 @@
+import datetime as dt
+
+import numpy as np
+import polars as pl
+import pytest
+
+
+@pytest.fixture
+def panel() -> pl.DataFrame:
+    """Small daily panel sorted by (permno, date), with the columns the signals read.
+
+    Asset 2 has missing returns and asset 3 lists a year in, so windows are
+    cut short and nulled like on real data.
+    """
+    rng = np.random.default_rng(0)
+    dates = pl.date_range(dt.date(2000, 1, 3), dt.date(2002, 12, 31), "1d", eager=True)
+    dates = dates.filter(dates.dt.weekday() <= 5)
+
+    frames = []
+    for permno in [1, 2, 3, 4]:
+        n = len(dates)
+        returns = rng.normal(0.0005, 0.02, n)
+        if permno == 2:
+            returns[rng.choice(n, 20, replace=False)] = np.nan
+        frame = pl.DataFrame(
+            {
+                "date": dates,
+                "permno": permno,
+                "return": returns,
+                "residual_ff3": rng.normal(0, 0.01, n),
+                "price": np.exp(rng.normal(2, 1, n)),
+                "market_cap": np.exp(rng.normal(12, 2, n)),
+            },
+        ).with_columns(pl.col("return").fill_nan(None))
+        if permno == 3:
+            frame = frame.filter(pl.col("date").ge(dt.date(2001, 1, 1)))
+        frames.append(frame)
+
+    market = pl.DataFrame(
+        {
+            "date": dates,
+            "gamma_0": rng.normal(0.01, 0.005, len(dates)),
+            "gamma_1": rng.normal(-0.5, 0.1, len(dates)),
+            "bear_indicator": rng.integers(0, 2, len(dates)),
+            "rmrf_variance": rng.uniform(0.001, 0.01, len(dates)),
+        }
+    )
+    return pl.concat(frames).join(market, on="date", how="left", maintain_order="left")
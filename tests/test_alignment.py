@@ -0,0 +1,72 @@
+import datetime as dt
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from research.alignment import align_asof
+from research.storage import write_dataset
+
+START, END = dt.date(2001, 1, 1), dt.date(2001, 12, 31)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def latest_before(
+    data: pl.DataFrame, other: pl.DataFrame, by: list[str], days: int
+) -> pl.DataFrame:
+    """The as-of join written out row by row."""
+    rows = []
+    for row in data.iter_rows(named=True):
+        candidates = other.filter(
+            pl.col("date").is_between(row["date"] - dt.timedelta(days=days), row["date"]),
+            *[pl.col(col).eq(row[col]) for col in by],
+        )
+        latest = candidates.sort("date").tail(1).drop("date", *by).to_dicts()
+        rows.append(row | (latest[0] if latest else {}))
+    return pl.DataFrame(rows, schema=data.schema | other.drop("date", *by).schema)
+
+
+def test_align_asof_per_asset(panel):
+    month_ends = (
+        panel.filter(pl.col("date").is_between(dt.date(2000, 6, 1), END))
+        .group_by("permno", pl.col("date").dt.month_end().alias("month"))
+        .agg(pl.col("date").max())
+        .drop("month")
+    )
+    betas = (
+        month_ends.with_columns(
+            pl.col("date").dt.ordinal_day().cast(pl.Float64).alias("alpha"),
+            pl.col("permno").cast(pl.Float64).alias("beta_mkt"),
+            pl.lit(0.5).alias("beta_smb"),
+            pl.lit(0.1).alias("beta_hml"),
+        )
+        # Asset 2 is no longer estimated, its last betas go stale
+        .filter((pl.col("permno") != 2) | pl.col("date").lt(dt.date(2001, 6, 1)))
+        .sort("permno", "date")
+    )
+    write_dataset(betas, "crsp_ff3_betas")
+
+    data = panel.filter(pl.col("date").is_between(START, END)).select("date", "permno")
+    aligned = align_asof(data.lazy(), "crsp_ff3_betas", START, END).collect()
+
+    betas = betas.with_columns(pl.col("permno").cast(data.schema["permno"]))
+    assert_frame_equal(aligned, latest_before(data, betas, ["permno"], 35))
+    assert aligned.filter(pl.col("permno").eq(2), pl.col("date").gt(dt.date(2001, 7, 6)))[
+        "beta_mkt"
+    ].is_null().all()
+
+
+def test_align_asof_by_date(panel):
+    coefficients = panel.filter(
+        pl.col("permno").eq(1), pl.col("date").dt.day().eq(15)
+    ).select("date", "gamma_0", "gamma_1")
+    write_dataset(coefficients, "dmom_coefficients/dmom_coefficients")
+
+    data = panel.filter(pl.col("date").is_between(START, END)).select("date", "permno")
+    aligned = align_asof(data.lazy(), "dmom_coefficients/dmom_coefficients", START, END)
+
+    assert_frame_equal(aligned.collect(), latest_before(data, coefficients, [], 35))
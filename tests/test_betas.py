@@ -0,0 +1,68 @@
+import datetime as dt
+
+import numpy as np
+import polars as pl
+import pytest
+
+from research.data.betas import SHARD_BOUNDS_KEY, betas_dataset, factor_betas_flow
+from research.storage import compact_dataset, dataset_dir, read_metadata, write_dataset
+
+START, END = dt.date(2000, 1, 3), dt.date(2000, 12, 29)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def crsp(panel):
+    rng = np.random.default_rng(2)
+    dates = panel["date"].unique().sort()
+    factors = pl.DataFrame(
+        {"date": dates}
+        | {
+            factor: rng.normal(0, 0.01, len(dates))
+            for factor in ["mkt_rf", "smb", "hml", "rmw", "cma", "rf"]
+        }
+    )
+    write_dataset(factors, "fama_french_factors/ff5", partition_by_year=False)
+    write_dataset(panel.select("date", "permno", "return"), "crsp")
+
+
+def test_compacted_betas_stay_up_to_date(crsp, capsys):
+    kwargs = dict(
+        name="crsp",
+        source="crsp",
+        id_col="permno",
+        start=START,
+        end=END,
+        models=["capm"],
+        windows=[60],
+        n_shards=4,
+        n_workers=1,
+    )
+    factor_betas_flow(**kwargs)
+    dataset = betas_dataset("crsp", "capm", 60)
+    assert len(list(dataset_dir(dataset).glob("year=2000/part-*.parquet"))) > 1
+    bounds = read_metadata(dataset)[SHARD_BOUNDS_KEY]
+
+    compact_dataset(dataset)
+    assert [path.name for path in dataset_dir(dataset).glob("year=2000/*")] == ["part-0.parquet"]
+    assert read_metadata(dataset)[SHARD_BOUNDS_KEY] == bounds
+
+    capsys.readouterr()
+    factor_betas_flow(**kwargs, incremental=True)
+    assert "betas are up to date" in capsys.readouterr().out
+
+
+def test_parts_with_different_versions_are_not_compacted():
+    data = pl.DataFrame({"date": [dt.date(2000, 1, 3)], "permno": [1], "residual_ff3": [0.0]})
+    write_dataset(data, "crsp_ff3_residuals", part=0, metadata={"version": "a"})
+    write_dataset(
+        data.with_columns(permno=2), "crsp_ff3_residuals", part=1, metadata={"version": "b"}
+    )
+
+    with pytest.raises(ValueError):
+        compact_dataset("crsp_ff3_residuals")
+    assert len(list(dataset_dir("crsp_ff3_residuals").glob("**/part-*.parquet"))) == 2
@@ -0,0 +1,84 @@
+import time
+
+import polars as pl
+import pytest
+
+from research.data.pipeline import run_pipeline
+from research.models import Stage
+from research.storage import dataset_dir, write_parquet
+
+
+def write_flow(name: str, calls: list[str]):
+    def flow() -> None:
+        calls.append(name)
+        write_parquet(pl.DataFrame({"date": [0]}), dataset_dir(name) / "part-0.parquet")
+
+    return flow
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_skipped_stage_releases_its_dependents():
+    calls = []
+    stages = [
+        Stage(name="a", flow=write_flow("a", calls), inputs=[], outputs=["a"]),
+        Stage(name="b", flow=write_flow("b", calls), inputs=["a"], outputs=["b"]),
+        Stage(name="c", flow=write_flow("c", calls), inputs=["b"], outputs=["c"]),
+    ]
+    run_pipeline(stages)
+    assert calls == ["a", "b", "c"]
+
+    # a always reruns and b is then skipped, which makes c ready with nothing running
+    run_pipeline(stages)
+    assert calls == ["a", "b", "c", "a"]
+
+
+def test_cycle_is_reported():
+    calls = []
+    stages = [
+        Stage(name="a", flow=write_flow("a", calls), inputs=["b"], outputs=["a"]),
+        Stage(name="b", flow=write_flow("b", calls), inputs=["a"], outputs=["b"]),
+    ]
+    with pytest.raises(ValueError, match="cycle"):
+        run_pipeline(stages)
+    assert calls == []
+
+
+def test_failed_stage_skips_downstream():
+    calls = []
+
+    def fail() -> None:
+        raise OSError("source unavailable")
+
+    stages = [
+        Stage(name="a", flow=fail, inputs=[], outputs=["a"]),
+        Stage(name="b", flow=write_flow("b", calls), inputs=["a"], outputs=["b"]),
+        Stage(name="c", flow=write_flow("c", calls), inputs=[], outputs=["c"]),
+    ]
+    with pytest.raises(RuntimeError, match=r"\['a', 'b'\]"):
+        run_pipeline(stages)
+    assert calls == ["c"]
+
+
+def test_process_pool_stages_run_one_at_a_time():
+    active, overlaps = [], []
+
+    def pool_flow(name: str):
+        def flow() -> None:
+            overlaps.append(len(active))
+            active.append(name)
+            time.sleep(0.05)
+            active.remove(name)
+            write_parquet(pl.DataFrame({"date": [0]}), dataset_dir(name) / "part-0.parquet")
+
+        return flow
+
+    stages = [
+        Stage(name=name, flow=pool_flow(name), inputs=[], outputs=[name], process_pool=True)
+        for name in ["a", "b", "c"]
+    ]
+    run_pipeline(stages)
+    assert overlaps == [0, 0, 0]
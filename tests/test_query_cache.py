@@ -0,0 +1,54 @@
+import datetime as dt
+import json
+
+import polars as pl
+import pytest
+
+from research.data import query_cache
+from research.data.query_cache import cached_query
+
+CALLS = []
+
+
+def load_prices(start: dt.date, end: dt.date, columns: list[str]) -> pl.DataFrame:
+    CALLS.append((start, end))
+    dates = pl.date_range(start, end, eager=True)
+    return pl.DataFrame({"date": dates, "price": range(len(dates))}).select(columns)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    CALLS.clear()
+
+
+def test_sub_range_is_served_from_cache():
+    full = cached_query(load_prices, dt.date(2020, 1, 1), dt.date(2020, 12, 31), ["date", "price"])
+    part = cached_query(load_prices, dt.date(2020, 3, 1), dt.date(2020, 3, 31), ["price", "date"])
+
+    assert len(CALLS) == 1
+    assert part.equals(
+        full.filter(pl.col("date").is_between(dt.date(2020, 3, 1), dt.date(2020, 3, 31)))
+        .select("price", "date")
+    )
+
+
+def test_expired_results_are_fetched_again():
+    cached_query(load_prices, dt.date(2020, 1, 1), dt.date(2020, 12, 31), ["date", "price"])
+
+    entries = json.loads(query_cache.INDEX_FILE.read_text())
+    entries[0]["fetched"] = "2000-01-01"
+    query_cache.INDEX_FILE.write_text(json.dumps(entries))
+
+    cached_query(load_prices, dt.date(2020, 1, 1), dt.date(2020, 12, 31), ["date", "price"])
+    assert len(CALLS) == 2
+    assert len(json.loads(query_cache.INDEX_FILE.read_text())) == 1
+
+
+def test_recent_ranges_are_not_cached():
+    today = dt.date.today()
+    for _ in range(2):
+        cached_query(load_prices, today - dt.timedelta(days=30), today, ["date", "price"])
+
+    assert len(CALLS) == 2
+    assert not query_cache.INDEX_FILE.exists()
@@ -0,0 +1,52 @@
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from research.regressions import rolling_ols, rolling_ols_models
+
+MODELS = {"capm": ["mkt_rf"], "ff3": ["mkt_rf", "smb", "hml"]}
+
+
+def factor_panel(panel: pl.DataFrame) -> pl.DataFrame:
+    rng = np.random.default_rng(1)
+    factors = rng.normal(0, 0.01, (panel.height, 3))
+    # A missing factor return only drops the models that use it
+    factors[rng.choice(panel.height, 30, replace=False), 2] = np.nan
+    return panel.with_columns(
+        pl.Series(name, factors[:, i], nan_to_null=True)
+        for i, name in enumerate(["mkt_rf", "smb", "hml"])
+    )
+
+
+def lstsq_by_window(data: pl.DataFrame, x: list[str], window: int) -> pl.DataFrame:
+    """Each window solved on its own, null when any of its rows is missing."""
+    rows = []
+    for (permno,), group in data.group_by("permno", maintain_order=True):
+        values = group.select("return", *x).to_numpy().astype(float)
+        for i, date in enumerate(group["date"]):
+            coefficients = [None] * (len(x) + 1)
+            block = values[max(i + 1 - window, 0) : i + 1]
+            if len(block) == window and np.isfinite(block).all():
+                design = np.column_stack([np.ones(window), block[:, 1:]])
+                coefficients = np.linalg.lstsq(design, block[:, 0], rcond=None)[0].tolist()
+            rows.append([date, permno, *coefficients])
+    schema = {"date": pl.Date, "permno": data.schema["permno"]}
+    return pl.DataFrame(
+        rows, schema=schema | {col: pl.Float64 for col in ["const", *x]}, orient="row"
+    )
+
+
+def test_rolling_ols_models_match_each_window(panel):
+    data = factor_panel(panel)
+    results = rolling_ols_models(data, "permno", "return", MODELS, windows=[60, 120])
+
+    for (name, window), result in results.items():
+        assert_frame_equal(result, lstsq_by_window(data, MODELS[name], window))
+
+
+def test_rolling_ols_in_chunks(panel):
+    data = factor_panel(panel)
+    assert_frame_equal(
+        rolling_ols(data, "permno", "return", MODELS["ff3"], 60, chunk_size=500),
+        rolling_ols(data, "permno", "return", MODELS["ff3"], 60),
+    )
@@ -0,0 +1,59 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from research.signal_state import (
+    advance_signal_state,
+    init_signal_state,
+    last_state_date,
+    save_state,
+)
+from research.signals import get_signal, with_signals
+
+SIGNAL_NAMES = [
+    "momentum",
+    "constant_volatility_scaled_momentum",
+    "semi_volatility_scaled_momentum",
+    "dynamic_volatility_scaled_momentum",
+]
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_advanced_state_matches_batch(panel):
+    signals = [get_signal(name, id_col="permno") for name in SIGNAL_NAMES]
+    dates = panel["date"].unique().sort()
+    batch = with_signals(panel, signals)
+
+    cut = dates[-40]
+    state = init_signal_state(panel.filter(pl.col("date").le(cut)), signals, "permno")
+    save_state("test", state, signals, "permno")
+
+    # Advance a few days at a time, like daily incremental runs
+    pieces = []
+    for last in [dates[-30], dates[-10], dates[-1]]:
+        rows, state = advance_signal_state(
+            "test", panel.filter(pl.col("date").le(last)), signals, "permno"
+        )
+        assert last_state_date("test") < last
+        save_state("test", state, signals, "permno")
+        assert last_state_date("test") == last
+        pieces.append(rows)
+
+    assert_frame_equal(
+        pl.concat(pieces).sort("permno", "date"),
+        batch.filter(pl.col("date").gt(cut)).sort("permno", "date"),
+    )
+
+
+def test_state_of_other_signals_is_rejected(panel):
+    momentum = [get_signal("momentum", id_col="permno")]
+    save_state("test", init_signal_state(panel, momentum, "permno"), momentum, "permno")
+
+    with pytest.raises(ValueError):
+        advance_signal_state(
+            "test", panel, [get_signal("semi_volatility_scaled_momentum", "permno")], "permno"
+        )
@@ -0,0 +1,96 @@
+import datetime as dt
+from itertools import product
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from research.filters import apply_filters, get_filter
+from research.signals import (
+    MOMENTUM_GRID_FORMATIONS,
+    MOMENTUM_GRID_SKIPS,
+    TRADING_DAYS_PER_MONTH,
+    cached_signals,
+    construct_filtered_signals,
+    construct_signals,
+    get_signal,
+    grid_momentum,
+    grid_momentum_name,
+    load_signal_index,
+    momentum_grid,
+    with_signals,
+)
+
+SIGNAL_NAMES = [
+    "momentum",
+    "volatility_scaled_idiosyncratic_momentum_fama_french_3",
+    "semi_volatility_scaled_momentum",
+    "dynamic_volatility_scaled_momentum",
+]
+FILTER_NAMES = ["penny-stocks", "micro-caps", "null-signal"]
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_fused_signals_match_one_at_a_time(panel):
+    signals = [get_signal(name, id_col="permno") for name in SIGNAL_NAMES]
+    filters = {
+        signal.name: [
+            get_filter(filter_name, signal_name=signal.name) for filter_name in FILTER_NAMES
+        ]
+        for signal in signals
+    }
+    filters["momentum"].append(get_filter("null-idiosyncratic-momentum"))
+
+    for signal, filtered in construct_filtered_signals(panel, signals, filters):
+        expected = apply_filters(construct_signals(panel, signal), filters[signal.name])
+        # Each signal's rows carry the other signals' columns too
+        assert_frame_equal(filtered.select(expected.columns), expected)
+
+
+def test_cached_signals_match_fresh(panel, monkeypatch):
+    signals = [get_signal(name, id_col="permno") for name in SIGNAL_NAMES]
+    start, end = dt.date(2001, 6, 1), dt.date(2002, 12, 31)
+
+    first = cached_signals(panel, signals, [], start, end)
+    assert len(load_signal_index()) == len(signals)
+    # The second call reads every signal back from the cache
+    second = cached_signals(panel, signals, [], start, end)
+    # A range inside the cached one is cut out of the stored values
+    inner_start = dt.date(2002, 1, 1)
+    inner = cached_signals(
+        panel.filter(pl.col("date").ge(dt.date(2001, 1, 1))), signals, [], inner_start, end
+    )
+
+    monkeypatch.setenv("RESEARCH_SIGNAL_CACHE", "0")
+    fresh = cached_signals(panel, signals, [], start, end)
+
+    assert_frame_equal(first, fresh)
+    assert_frame_equal(second, fresh)
+    assert_frame_equal(
+        inner.filter(pl.col("date").ge(inner_start)),
+        fresh.filter(pl.col("date").ge(inner_start)),
+    )
+    # Signals are null on the warm-up rows, cached or not
+    warm_up = fresh.filter(pl.col("date").lt(start))
+    for signal in signals:
+        assert warm_up[signal.name].null_count() == warm_up.height
+
+
+def test_momentum_grid_matches_rolling_sum(panel):
+    # The default grid in one pass, and a pair outside it
+    signals = [*momentum_grid("permno"), grid_momentum("permno", formation=2, skip=3)]
+    data = with_signals(panel, signals)
+
+    for formation, skip in [*product(MOMENTUM_GRID_FORMATIONS, MOMENTUM_GRID_SKIPS), (2, 3)]:
+        window = formation * TRADING_DAYS_PER_MONTH
+        lag = skip * TRADING_DAYS_PER_MONTH
+        expected = pl.col("return").log1p().rolling_sum(window).shift(lag).over("permno")
+
+        assert_frame_equal(
+            data.select(pl.col(grid_momentum_name(formation, skip)).alias("expected")),
+            data.select(expected.alias("expected")),
+        )
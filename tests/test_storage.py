@@ -0,0 +1,117 @@
+import datetime as dt
+
+import polars as pl
+import pytest
+
+from research.storage import (
+    dataset_exists,
+    read_metadata,
+    scan_dataset,
+    shift_trading_days,
+    staged_dataset,
+    staging_dir,
+    write_dataset,
+)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def residuals(year: int, value: float) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [dt.date(year, 1, 2), dt.date(year, 1, 3)],
+            "permno": [1, 1],
+            "residual_ff3": [value, value],
+        }
+    )
+
+
+def test_staged_dataset_replaces_on_success():
+    write_dataset(residuals(2000, 0.0), "crsp_ff3_residuals", metadata={"version": "old"})
+
+    with staged_dataset("crsp_ff3_residuals"):
+        write_dataset(
+            residuals(2001, 1.0), "crsp_ff3_residuals", metadata={"version": "new"}, staged=True
+        )
+        # Readers keep seeing the old dataset while the build runs
+        assert read_metadata("crsp_ff3_residuals")["version"] == "old"
+
+    data = scan_dataset("crsp_ff3_residuals").collect()
+    assert data["date"].dt.year().unique().to_list() == [2001]
+    assert read_metadata("crsp_ff3_residuals")["version"] == "new"
+    assert not staging_dir("crsp_ff3_residuals").exists()
+
+
+def test_failed_build_keeps_previous_dataset():
+    write_dataset(residuals(2000, 0.0), "crsp_ff3_residuals", metadata={"version": "old"})
+
+    with pytest.raises(RuntimeError):
+        with staged_dataset("crsp_ff3_residuals"):
+            write_dataset(
+                residuals(2001, 1.0), "crsp_ff3_residuals", metadata={"version": "new"}, staged=True
+            )
+            raise RuntimeError("interrupted")
+
+    assert read_metadata("crsp_ff3_residuals")["version"] == "old"
+    assert scan_dataset("crsp_ff3_residuals").collect().equals(
+        residuals(2000, 0.0).cast({"permno": pl.Int32})
+    )
+    assert not staging_dir("crsp_ff3_residuals").exists()
+
+
+def test_staged_build_of_a_new_dataset():
+    with staged_dataset("crsp_ff3_residuals"):
+        write_dataset(residuals(2000, 0.0), "crsp_ff3_residuals", staged=True)
+        assert not dataset_exists("crsp_ff3_residuals")
+
+    assert dataset_exists("crsp_ff3_residuals")
+
+
+def test_ipc_cache_scan_outside_the_stored_years(monkeypatch):
+    monkeypatch.setenv("RESEARCH_IPC_CACHE", "1")
+    write_dataset(residuals(2000, 0.0), "crsp_ff3_residuals")
+
+    data = scan_dataset("crsp_ff3_residuals", dt.date(2010, 1, 1), dt.date(2010, 12, 31))
+    assert data.collect().is_empty()
+    assert data.collect_schema().names() == ["date", "permno", "residual_ff3"]
+
+    data = scan_dataset("crsp_ff3_residuals", dt.date(2000, 1, 1), dt.date(2000, 12, 31))
+    assert data.collect().equals(scan_dataset("crsp_ff3_residuals").collect())
+
+
+def test_trimmed_warm_up_matches_full_history():
+    dates = pl.date_range(dt.date(2000, 1, 3), dt.date(2003, 12, 31), "1d", eager=True)
+    data = pl.concat(
+        [
+            # Listed throughout
+            pl.DataFrame({"date": dates, "permno": 1}),
+            # Halted for two years before the study starts
+            pl.DataFrame({"date": dates, "permno": 2}).filter(
+                ~pl.col("date").is_between(dt.date(2001, 1, 1), dt.date(2002, 12, 28))
+            ),
+            # Listed a few days before the study starts
+            pl.DataFrame({"date": dates, "permno": 3}).filter(
+                pl.col("date").ge(dt.date(2002, 12, 20))
+            ),
+        ]
+    ).with_columns(pl.int_range(pl.len()).cast(pl.Float64).alias("residual_ff3"))
+    write_dataset(data, "crsp_ff3_residuals")
+
+    start, window = dt.date(2003, 1, 1), 30
+    load_start = shift_trading_days("crsp_ff3_residuals", start, -window)
+    assert load_start <= dt.date(2000, 12, 31)
+
+    def rolling(data: pl.LazyFrame) -> pl.DataFrame:
+        return (
+            data.with_columns(
+                pl.col("residual_ff3").rolling_mean(window, min_samples=1).over("permno")
+            )
+            .filter(pl.col("date").ge(start))
+            .collect()
+        )
+
+    trimmed = rolling(scan_dataset("crsp_ff3_residuals", load_start))
+    assert trimmed.equals(rolling(scan_dataset("crsp_ff3_residuals")))